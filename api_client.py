@@ -0,0 +1,124 @@
+import http.client
+import logging
+import queue
+import random
+import threading
+import time
+
+from run_metrics import runMetrics
+
+# Coinbase Advanced Trade allows 30 requests per second per user on the private REST endpoints
+COINBASE_REQUESTS_PER_SECOND = 30
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds):
+        # A 429 means the exchange counted more than we did; stop issuing requests for a while
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class ApiClient:
+    def __init__(self, host, pool_size=8, timeout=30, max_retries=4, backoff_base=0.5, backoff_max=8.0,
+                 rate=COINBASE_REQUESTS_PER_SECOND, burst=None, use_tls=True):
+        self.host = host
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.use_tls = use_tls
+        self.limiter = TokenBucket(rate, burst)
+        self.idle = queue.LifoQueue()
+
+    def newConnection(self):
+        if self.use_tls:
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def acquireConnection(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.newConnection()
+
+    def releaseConnection(self, connection, response):
+        if response.will_close or self.idle.qsize() >= self.pool_size:
+            connection.close()
+        else:
+            self.idle.put(connection)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter keeps parallel callers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, uri, body=None, headers=None):
+        # Returns (status, response headers, decoded body). Orders carry a client_order_id,
+        # so retrying a POST after a dropped connection cannot place the same order twice.
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            connection = self.acquireConnection()
+
+            try:
+                connection.request(method, uri, body, headers or {})
+                response = connection.getresponse()
+                data = response.read().decode("utf-8")
+            except (http.client.HTTPException, OSError) as e:
+                # Typically a keep-alive connection the server already closed: reconnect and retry
+                connection.close()
+                if attempt == self.max_retries:
+                    raise
+                wait = self.backoff(attempt)
+                runMetrics.count('api_retries')
+                logging.warning("%s %s failed with %r, retrying in %.2fs", method, uri, e, wait, extra={'endpoint': uri})
+                time.sleep(wait)
+                continue
+
+            self.releaseConnection(connection, response)
+            responseHeaders = dict(response.getheaders())
+
+            if response.status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                wait = self.backoff(attempt, responseHeaders.get('Retry-After'))
+                runMetrics.count('api_retries')
+                if response.status == 429:
+                    runMetrics.count('api_rate_limited')
+                    self.limiter.drain(wait)
+                logging.warning("%s %s returned %s, retrying in %.2fs", method, uri, response.status, wait,
+                                extra={'endpoint': uri, 'status': response.status})
+                time.sleep(wait)
+                continue
+
+            return response.status, responseHeaders, data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,163 @@
+from common_functions import *
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Candle lengths the candles endpoint accepts, in seconds
+CANDLE_GRANULARITIES = {
+    'ONE_MINUTE': 60,
+    'FIVE_MINUTE': 300,
+    'FIFTEEN_MINUTE': 900,
+    'THIRTY_MINUTE': 1800,
+    'ONE_HOUR': 3600,
+    'TWO_HOUR': 7200,
+    'SIX_HOUR': 21600,
+    'ONE_DAY': 86400,
+}
+MAX_CANDLES_PER_REQUEST = 350
+
+def parseBackfillArguments():
+    parser = argparse.ArgumentParser(description="Fill gaps in market_data with candles from the Coinbase API",
+                                     parents=[commonParser])
+    parser.add_argument('--days', type=float, default=4, help='How far back to look for gaps (default: the 4 day RSI window)')
+    parser.add_argument('--symbol', action='append', help='Symbol to backfill, repeatable (default: all EUR pairs)')
+    parser.add_argument('--granularity', default='FIFTEEN_MINUTE', choices=list(CANDLE_GRANULARITIES),
+                        help='Candle length, the interval between backfilled prices')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent candle requests')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the gaps')
+    return parser.parse_args()
+
+def findGaps(symbols, since, until, max_gap):
+    # (symbol, after, before) ranges without a price for longer than max_gap: between consecutive rows, before the
+    # first and after the last row of the window, or the whole window for symbols without any rows
+    gaps = []
+    with engine.connect() as connection:
+        interior = connection.execute(text("""
+        SELECT symbol, previous, timestamp FROM (
+            SELECT symbol, timestamp, LAG(timestamp) OVER (PARTITION BY symbol ORDER BY timestamp) AS previous
+            FROM market_data
+            WHERE symbol IN :symbols AND timestamp >= :since
+        ) ticks
+        WHERE timestamp - previous > :max_gap
+        """), {"symbols": tuple(symbols), "since": since, "max_gap": max_gap}).fetchall()
+        bounds = connection.execute(text("""
+        SELECT symbol, MIN(timestamp), MAX(timestamp) FROM market_data
+        WHERE symbol IN :symbols AND timestamp >= :since
+        GROUP BY symbol
+        """), {"symbols": tuple(symbols), "since": since}).fetchall()
+
+    gaps.extend((symbol, pd.Timestamp(previous), pd.Timestamp(timestamp)) for symbol, previous, timestamp in interior)
+    seen = set()
+    for symbol, first, last in bounds:
+        seen.add(symbol)
+        first, last = pd.Timestamp(first), pd.Timestamp(last)
+        if first - since > max_gap:
+            gaps.append((symbol, since, first))
+        if until - last > max_gap:
+            gaps.append((symbol, last, until))
+    gaps.extend((symbol, since, until) for symbol in symbols if symbol not in seen)
+    return sorted(gaps)
+
+def candleRequests(gaps, granularity):
+    # One request per MAX_CANDLES_PER_REQUEST candles; start and end are the first and last candle start
+    seconds = CANDLE_GRANULARITIES[granularity]
+    span = seconds * (MAX_CANDLES_PER_REQUEST - 1)
+    requests = []
+    for symbol, after, before in gaps:
+        start = int(after.timestamp()) // seconds * seconds
+        end = int(before.timestamp()) - seconds
+        while start <= end:
+            requests.append((symbol, after, before, start, min(start + span, end)))
+            start += span + seconds
+    return requests
+
+def fetchCandles(product_id, start, end, granularity):
+    response = getResponseFromAPI(f"/api/v3/brokerage/products/{product_id}/candles?start={start}&end={end}&granularity={granularity}")
+    if response is None:
+        return []
+    return json.loads(response).get('candles', [])
+
+def candleRows(symbol, candles, after, before, granularity):
+    # A candle's close is the price at its end, so that is the row's timestamp; only candles ending inside the gap
+    # and already closed are used, which keeps a second run from inserting them again
+    seconds = CANDLE_GRANULARITIES[granularity]
+    now = pd.Timestamp.now(tz='UTC')
+    rows = []
+    for candle in candles:
+        timestamp = pd.Timestamp(int(candle['start']) + seconds, unit='s', tz='UTC')
+        if after < timestamp < before and timestamp <= now:
+            rows.append((symbol, candle['close'], timestamp, None))
+    return rows
+
+def backfillMarketData(symbols=None, days=4, granularity='FIFTEEN_MINUTE', workers=8, dry_run=False):
+    products = {p['base_currency_id']: p['product_id'] for p in getAllEURQuotes()}
+    symbols = [symbol for symbol in (symbols or products) if symbol in products]
+    if not symbols:
+        return {'gaps': 0, 'requests': 0, 'rows': 0}
+
+    until = pd.Timestamp.now(tz='UTC')
+    since = until - pd.Timedelta(days=days)
+    # A missed sample is not a gap yet; two missed ones are
+    maxGap = pd.Timedelta(seconds=2 * CANDLE_GRANULARITIES[granularity])
+    with runMetrics.span('backfill_gaps'):
+        gaps = findGaps(symbols, since, until, maxGap)
+    requests = candleRequests(gaps, granularity)
+    logging.info("Found %d gaps in %d symbols, %d candle requests", len(gaps), len({gap[0] for gap in gaps}), len(requests))
+    if dry_run:
+        for symbol, after, before in gaps:
+            print(f"{symbol}: {after} - {before}")
+        return {'gaps': len(gaps), 'requests': len(requests), 'rows': 0}
+
+    # The API client's token bucket keeps the workers under the rate limit; rows are stored as requests finish
+    stored = 0
+    backfilled = set()
+
+    def flush(rows):
+        # A batch is one transaction, so any stored row means all of its symbols got their rows
+        count = storeMarketDataBatch(rows, skip_duplicates=SKIP_DUPLICATES)
+        if count:
+            backfilled.update(symbol for symbol, _, _, _ in rows)
+        return count
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(fetchCandles, products[symbol], start, end, granularity): (symbol, after, before)
+            for symbol, after, before, start, end in requests
+        }
+        pending = []
+        for future in as_completed(futures):
+            symbol, after, before = futures[future]
+            try:
+                rows = candleRows(symbol, future.result(), after, before, granularity)
+            except Exception as e:
+                logging.error("Failed to fetch candles for %s: %s", symbol, e, extra={'symbol': symbol})
+                continue
+            pending.extend(rows)
+            if len(pending) >= 5000:
+                stored += flush(pending)
+                pending = []
+        stored += flush(pending)
+
+    if backfilled:
+        # The incremental RSI state does not know about the older prices. Deleting its row is the reset marker: a
+        # running loader, daemon or stream sees the row gone and rebuilds the state from market_data. The rows are
+        # locked in symbol order, the same order the engine locks them in, so the two cannot deadlock.
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("""
+                DELETE FROM rsi_state WHERE ctid IN (
+                    SELECT ctid FROM rsi_state WHERE symbol IN :symbols ORDER BY symbol, bar_interval, periods FOR UPDATE
+                )
+                """), {"symbols": tuple(backfilled)})
+        except exc.SQLAlchemyError as e:
+            logging.warning("Could not reset the RSI state of the backfilled symbols: %s", e)
+
+    logging.info("Backfilled %d rows for %d symbols", stored, len(backfilled))
+    return {'gaps': len(gaps), 'requests': len(requests), 'rows': stored}
+
+if __name__ == '__main__':
+    backfillArgs = parseBackfillArguments()
+    started = time.perf_counter()
+    result = backfillMarketData(backfillArgs.symbol, backfillArgs.days, backfillArgs.granularity,
+                                backfillArgs.workers, backfillArgs.dry_run)
+    print(f"{result['gaps']} gaps, {result['requests']} candle requests, {result['rows']} rows inserted "
+          f"in {time.perf_counter() - started:.2f}s")
+    storeRunMetrics(engine, 'backfill')
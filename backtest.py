@@ -0,0 +1,134 @@
+from common_functions import *
+from history_cache import historyCache
+from indicators import resampleToPriceMatrix, calculateRsiMatrix
+
+DEFAULT_STRATEGY = {
+    'rsi_periods': RSI_PERIODS,
+    'interval': RSI_INTERVAL,
+    'buy_below': BUY_RSI_THRESHOLD,
+    'sell_above': SELL_RSI_THRESHOLD,
+    'top_n': MAX_BUY_OPPORTUNITIES,
+    'min_order': MIN_ORDER_EUR,
+}
+
+def parseBacktestArguments():
+    parser = argparse.ArgumentParser(description="Replay market_data through the trading bot's buy and sell rules",
+                                     parents=[commonParser])
+    parser.add_argument('--days', type=int, default=365, help='Number of days of history to replay')
+    parser.add_argument('--interval', default=RSI_INTERVAL, help='Bar interval used for the RSI')
+    parser.add_argument('--rsi-periods', type=int, default=RSI_PERIODS, help='RSI span')
+    parser.add_argument('--rebalance', default='4h', help='How often the simulated bot runs')
+    parser.add_argument('--start-eur', type=float, default=1000.0, help='Starting EUR balance')
+    parser.add_argument('--fee', type=float, default=0.006, help='Fee rate charged on every order')
+    parser.add_argument('--output', help='Write the simulated trades to this CSV file')
+    parser.add_argument('--cache', action='store_true', help='Read raw ticks from the local history cache')
+    return parser.parse_args()
+
+def loadPriceHistory(days, symbols=None, intervals=None, cache=False):
+    # With intervals that are whole hours or days the hourly or daily closes are enough, and they outlive the
+    # retention of the raw ticks. Raw ticks come from the local history cache when asked to.
+    with engine.connect() as connection:
+        table = rollupTableFor(intervals) if intervals is not None and rollupsAvailable(connection) else None
+
+    if cache and not table:
+        historyCache.sync(engine)
+        ticks = historyCache.load(days, symbols)
+    else:
+        price, timestamp = ('close', 'bucket') if table else ('price', 'timestamp')
+        query = f"""
+        SELECT symbol, {price}::float8 AS price, {timestamp} AS timestamp
+        FROM {table or 'market_data'}
+        WHERE {timestamp} >= :since
+        """
+        params = {"since": datetime.now() - timedelta(days=days)}
+        if symbols:
+            query += " AND symbol IN :symbols"
+            params["symbols"] = tuple(symbols)
+        query += f" ORDER BY {timestamp}"
+
+        with engine.connect() as connection:
+            ticks = pd.read_sql_query(text(query), connection, params=params)
+
+    ticks['timestamp'] = pd.to_datetime(ticks['timestamp'])
+    return ticks[~ticks['symbol'].isin(known_stablecoins)]
+
+def runBacktest(prices, rsi, strategy=None, rebalance='4h', start_eur=1000.0, fee=0.006, min_sell_value=0.90):
+    strategy = {**DEFAULT_STRATEGY, **(strategy or {})}
+    symbols = prices.columns.to_numpy()
+    priceValues = prices.to_numpy(dtype=float)
+    valuationPrices = prices.ffill().to_numpy(dtype=float)
+    rsiValues = rsi.to_numpy(dtype=float)
+
+    steps = np.flatnonzero(((prices.index - prices.index[0]) % pd.Timedelta(rebalance)) == pd.Timedelta(0))
+    holdings = np.zeros(len(symbols))
+    eur = float(start_eur)
+    trades = []
+    equity = np.empty(len(steps))
+
+    for n, step in enumerate(steps):
+        timestamp = prices.index[step]
+        price = priceValues[step]
+        stepRsi = rsiValues[step]
+
+        # Sell phase: whole wallet of every coin above the sell threshold worth more than the dust limit
+        sellable = (holdings * np.nan_to_num(price) > min_sell_value) & (holdings > 0.00001) & (stepRsi > strategy['sell_above'])
+        for i in np.flatnonzero(sellable):
+            total_value = holdings[i] * price[i] * (1 - fee)
+            trades.append((timestamp, symbols[i], 'SELL', holdings[i], price[i], total_value))
+            eur += total_value
+            holdings[i] = 0.0
+
+        # Buy phase: only the lowest RSI candidates can be picked, so hand just those to the live rules
+        candidates = np.flatnonzero((stepRsi > 0) & (stepRsi < strategy['buy_below']))
+        if len(candidates) and eur >= strategy['min_order']:
+            if len(candidates) > strategy['top_n']:
+                candidates = candidates[np.argpartition(stepRsi[candidates], strategy['top_n'] - 1)[:strategy['top_n']]]
+            analysis = {symbols[i]: {'currentPrice': price[i], 'rsi': stepRsi[i]} for i in candidates}
+            column = {symbols[i]: i for i in candidates}
+
+            for opportunity in selectBuyOpportunities(analysis, eur, strategy['buy_below'], strategy['top_n'], strategy['min_order']):
+                i = column[opportunity['symbol']]
+                amount_eur = float(opportunity['amount_eur'])
+                amount = amount_eur * (1 - fee) / price[i]
+                trades.append((timestamp, symbols[i], 'BUY', amount, price[i], amount_eur))
+                holdings[i] += amount
+                eur -= amount_eur
+
+        equity[n] = eur + np.nansum(holdings * valuationPrices[step])
+
+    trades = pd.DataFrame(trades, columns=['timestamp', 'symbol', 'type', 'amount', 'price', 'total_value'])
+    trades['transaction_id'] = [f"backtest-{n}" for n in range(len(trades))]
+    return trades, pd.Series(equity, index=prices.index[steps], name='equity')
+
+def summarizeBacktest(trades, equity, start_eur=1000.0):
+    drawdown = equity / equity.cummax() - 1
+    return {
+        'return': float(equity.iloc[-1] / start_eur - 1) if len(equity) else 0.0,
+        'max_drawdown': float(drawdown.min()) if len(equity) else 0.0,
+        'trades': len(trades),
+        'final_equity': float(equity.iloc[-1]) if len(equity) else start_eur,
+    }
+
+if __name__ == '__main__':
+    backtestArgs = parseBacktestArguments()
+    strategy = {'rsi_periods': backtestArgs.rsi_periods, 'interval': backtestArgs.interval}
+
+    started = time.perf_counter()
+    ticks = loadPriceHistory(backtestArgs.days, intervals=backtestArgs.interval, cache=backtestArgs.cache)
+    if ticks.empty:
+        print(f"No market data in the last {backtestArgs.days} days.")
+        raise SystemExit(1)
+
+    prices = resampleToPriceMatrix(ticks, interval=backtestArgs.interval)
+    rsi = calculateRsiMatrix(prices, periods=backtestArgs.rsi_periods)
+    trades, equity = runBacktest(prices, rsi, strategy, rebalance=backtestArgs.rebalance,
+                                 start_eur=backtestArgs.start_eur, fee=backtestArgs.fee)
+    summary = summarizeBacktest(trades, equity, start_eur=backtestArgs.start_eur)
+
+    print(f"Replayed {len(prices)} bars of {prices.shape[1]} symbols in {time.perf_counter() - started:.2f}s")
+    print(f"Return: {summary['return']:.2%}, max drawdown: {summary['max_drawdown']:.2%}, "
+          f"trades: {summary['trades']}, final equity: {summary['final_equity']:.2f} EUR")
+
+    if backtestArgs.output:
+        trades.to_csv(backtestArgs.output, index=False)
+        print(f"Trades written to {backtestArgs.output}")
@@ -0,0 +1,73 @@
+from common_functions import *
+import numpy as np
+import math
+
+def parseBenchmarkArguments():
+    parser = argparse.ArgumentParser(description="Benchmark determineAllCurrencyAnalysis against the per-symbol loop",
+                                     parents=[commonParser])
+    parser.add_argument('--symbols', type=int, default=500, help='Number of symbols')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of hourly rows per symbol')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic prices')
+    return parser.parse_args()
+
+def generateResampledData(symbols, rows, seed):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(end=pd.Timestamp.now().floor('h'), periods=rows, freq='h')
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=(symbols, rows)), axis=1))
+
+    df = pd.DataFrame({
+        'symbol': np.repeat([f"SYM{i}" for i in range(symbols)], rows),
+        'timestamp': np.tile(timestamps, symbols),
+        'price': prices.ravel()
+    })
+    # resampleData output is grouped by symbol; shuffle so neither implementation gets sorted input for free
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def determineAllCurrencyAnalysisPerSymbol(df, rsi_periods=14):
+    # The previous implementation: one boolean mask and sort per symbol
+    analysis = {}
+    for symbol in df['symbol'].unique():
+        symbol_data = df[df['symbol'] == symbol].sort_values('timestamp')
+
+        if len(symbol_data) < rsi_periods:
+            continue
+
+        prices = symbol_data['price'].astype(float)
+        current_price = prices.iloc[-1]
+        rsi = calculateRsi(prices, periods=rsi_periods).iloc[-1]
+
+        if pd.isna(current_price) or pd.isna(rsi):
+            continue
+
+        analysis[symbol] = {
+            'currentPrice': float(current_price),
+            'rsi': float(rsi)
+        }
+
+    return analysis
+
+def timeCall(function, df):
+    started = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - started
+
+if __name__ == '__main__':
+    benchmarkArgs = parseBenchmarkArguments()
+    df = generateResampledData(benchmarkArgs.symbols, benchmarkArgs.rows, benchmarkArgs.seed)
+    print(f"Benchmarking {benchmarkArgs.symbols} symbols x {benchmarkArgs.rows} rows ({len(df)} rows total)")
+
+    grouped, groupedSeconds = timeCall(determineAllCurrencyAnalysis, df)
+    perSymbol, perSymbolSeconds = timeCall(determineAllCurrencyAnalysisPerSymbol, df)
+
+    mismatches = [
+        symbol for symbol in perSymbol
+        if symbol not in grouped
+        or not math.isclose(perSymbol[symbol]['rsi'], grouped[symbol]['rsi'], rel_tol=1e-9, abs_tol=1e-9)
+        or perSymbol[symbol]['currentPrice'] != grouped[symbol]['currentPrice']
+    ]
+    if mismatches or len(grouped) != len(perSymbol):
+        print(f"Results differ for {len(mismatches)} symbols, e.g. {mismatches[:5]}")
+
+    print(f"Per-symbol loop: {perSymbolSeconds:.2f}s")
+    print(f"Grouped:         {groupedSeconds:.2f}s")
+    print(f"Speedup:         {perSymbolSeconds / groupedSeconds:.1f}x")
@@ -0,0 +1,152 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from fake_coinbase import FakeCoinbase
+
+SCENARIOS = ['api_listing', 'analysis', 'store_quotes', 'fetch_resample', 'trading_run']
+
+# The suite's own options are read before common_functions is imported, the whole command line is checked after
+suiteParser = argparse.ArgumentParser(add_help=False)
+suiteParser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Scenario to run, repeatable (default: all)')
+suiteParser.add_argument('--repeat', type=int, default=3, help='Runs per scenario')
+suiteParser.add_argument('--symbols', type=int, default=250, help='Number of EUR products and generated symbols')
+suiteParser.add_argument('--ticks', type=int, default=400, help='Ticks per symbol for the generated market data')
+suiteParser.add_argument('--populate', action='store_true', help='Fill market_data with generated ticks first')
+suiteParser.add_argument('--latency', type=float, default=0.0, help='Seconds the fake API adds to every response')
+suiteParser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Share of fake API responses that are 429s')
+suiteParser.add_argument('--output', help='JSON result file (default: benchmark-<commit>.json)')
+suiteParser.add_argument('--compare', help='Earlier JSON result file to compare the medians with')
+
+def fakeSigningKey():
+    # The fake API does not verify tokens, but getJwtToken still needs a valid EC key to sign them
+    key = ec.generate_private_key(ec.SECP256R1())
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode()
+
+suiteArgs = suiteParser.parse_known_args()[0]
+fakeApi = FakeCoinbase(symbols=suiteArgs.symbols, latency=suiteArgs.latency, rate_limit_ratio=suiteArgs.rate_limit_ratio)
+
+# common_functions reads its configuration on import, so the fake API has to be in place before that
+os.environ['COINBASE_API_URL'] = fakeApi.start()
+os.environ['COINBASE_API_KEY_NAME'] = 'organizations/benchmark/apiKeys/benchmark'
+os.environ['COINBASE_API_PRIVATE_KEY'] = fakeSigningKey()
+os.environ['PRODUCT_CATALOG_PATH'] = os.path.join(tempfile.mkdtemp(), 'products.json')
+if '--testing' not in sys.argv:
+    sys.argv.append('--testing')
+
+from common_functions import *
+from market_window import MarketWindow
+argparse.ArgumentParser(description="Time the bot end to end against a local fake Coinbase API",
+                        parents=[suiteParser, commonParser]).parse_args()
+generator = importlib.import_module('generate-market-data')
+
+def timeRuns(function, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        runs.append(time.perf_counter() - started)
+    return {'runs': runs, 'min': min(runs), 'median': statistics.median(runs), 'max': max(runs)}
+
+def scenarioApiListing():
+    getMarketSnapshot(refresh=True)
+    getAllAccounts()
+
+def scenarioAnalysis():
+    # In memory, so it runs without a database: the analysis of the generated ticks' hourly bars
+    bars = resampleData(syntheticTicks, interval=RSI_INTERVAL)
+    return lambda: determineAllCurrencyAnalysis(bars)
+
+def scenarioStoreQuotes():
+    dataLoader = importlib.import_module('coinbase-load-data')
+    return dataLoader.storeAllEURQuotes
+
+def scenarioFetchResample():
+    symbols = [product['base_currency_id'] for product in getAllEURQuotes()]
+    return lambda: resampleData(fetchMarketDataOfLastDays(symbols), interval=RSI_INTERVAL)
+
+def scenarioTradingRun():
+    tradingBot = importlib.import_module('trading-bot')
+
+    def run():
+        # Like a cron run: a fresh listing and an empty market window every time
+        getMarketSnapshot(refresh=True)
+        tradingBot.marketWindow = MarketWindow()
+        tradingBot.runTradingCycle()
+    return run
+
+def runScenario(name, repeat):
+    try:
+        if name == 'api_listing':
+            function = scenarioApiListing
+        elif name == 'analysis':
+            function = scenarioAnalysis()
+        elif name == 'store_quotes':
+            function = scenarioStoreQuotes()
+        elif name == 'fetch_resample':
+            function = scenarioFetchResample()
+        else:
+            function = scenarioTradingRun()
+        return timeRuns(function, repeat)
+    except Exception as e:
+        logging.exception("Benchmark scenario %s failed", name)
+        return {'error': repr(e)}
+
+def currentCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def printComparison(results, previous):
+    print(f"\nCompared with {previous.get('commit')} ({previous.get('created_at')}):")
+    for name, result in results['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name, {})
+        if 'median' in result and 'median' in before:
+            print(f"{name:16} {before['median']:9.4f}s -> {result['median']:9.4f}s ({result['median'] / before['median']:.2f}x)")
+
+if __name__ == '__main__':
+    syntheticTicks = generator.generateMarketTicks(suiteArgs.symbols, suiteArgs.ticks)
+    if suiteArgs.populate:
+        generator.copyMarketData(syntheticTicks, truncate=True)
+
+    results = {
+        'commit': currentCommit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'parameters': vars(suiteArgs),
+        'scenarios': {},
+    }
+    for name in suiteArgs.scenario or SCENARIOS:
+        results['scenarios'][name] = runScenario(name, suiteArgs.repeat)
+        result = results['scenarios'][name]
+        if 'error' in result:
+            print(f"{name:16} failed: {result['error']}")
+        else:
+            print(f"{name:16} median {result['median']:.4f}s (min {result['min']:.4f}s, max {result['max']:.4f}s)")
+
+    results['api'] = fakeApi.stats()
+    fakeApi.stop()
+
+    output = suiteArgs.output or f"benchmark-{results['commit'] or 'local'}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if suiteArgs.compare:
+        with open(suiteArgs.compare) as f:
+            printComparison(results, json.load(f))
@@ -1,14 +1,8 @@
 from common_functions import *
+from rsi_engine import IncrementalRsi
+from market_window import marketWindow
 
-def getCurrencyDetails(cId):
-    conn.request("GET", "/currencies/"+cId, payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    print(data.decode("utf-8"))
-
-def getProducts():
-    x = getResponseFromAPI(f"/api/v3/brokerage/market/products")
-    return x
+rsiEngine = IncrementalRsi(periods=14, interval='1h')
 
 def getPortfolio():
     w = getAccounts()
@@ -28,22 +22,49 @@ def storePortfolioBalance():
     x = getPortfolioBalance()
     storePortfolioData(x['value'], x['currency'])
 
-def getAllEURQuotes():
-    allQuotes = getProducts()
-    responseJson = json.loads(allQuotes)
-    eurProducts = [product for product in responseJson['products'] if product['quote_currency_id'] == 'EUR']
-    return eurProducts
+def prepareRsiEngine(symbols):
+    rsiEngine.dropInvalidated(symbols)
+    rsiEngine.load([symbol for symbol in symbols if symbol not in rsiEngine.states])
+    # Cold start, new listing or a gap longer than the analysis window
+    rsiEngine.rebuild([symbol for symbol in symbols if not rsiEngine.isWarm(symbol)])
 
-def getRsiValueForSymbol(symbol, period='1h'):
-    rsi = determineAllCurrencyAnalysis(resampleData(fetchMarketDataOfLastDays({symbol}), interval=period))
-    return rsi.get(symbol).get('rsi')
+def collectAllEURQuotes():
+    x = [p for p in getAllEURQuotes() if p.get('price')]
+    timestamp = pd.to_datetime('now')
+    prepareRsiEngine({p['base_currency_id'] for p in x})
 
-def storeAllEURQuotes():
-    x = getAllEURQuotes()
+    rows = []
     for p in x:
-        currentRsi = getRsiValueForSymbol(p['base_currency_id'])
-        storeMarketData(p['base_currency_id'], p['price'], pd.to_datetime('now'), currentRsi)
+        currentRsi = rsiEngine.update(p['base_currency_id'], timestamp, float(p['price']))
+        marketWindow.append(p['base_currency_id'], timestamp, float(p['price']))
+        rows.append((p['base_currency_id'], p['price'], timestamp, currentRsi))
+
+    return rows
+
+def storeAllEURQuotes():
+    # The RSI state is saved with the quotes it was computed from
+    storeIngestionBatch(collectAllEURQuotes(), skip_duplicates=SKIP_DUPLICATES, rsi_engine=rsiEngine)
+
+def runDataCollection():
+    marketRows = collectAllEURQuotes()
+    balance = getPortfolioBalance()
+    # Latest price and RSI per symbol, so the trading bot does not have to recompute them from market_data
+    analysisRows = [
+        (symbol, price, rsi, rsiEngine.states[symbol].bar_time, timestamp)
+        for symbol, price, timestamp, rsi in marketRows if rsi is not None
+    ]
+    storeIngestionBatch(marketRows, [(balance['value'], balance['currency'])], skip_duplicates=SKIP_DUPLICATES,
+                        analysis_rows=analysisRows, rsi_engine=rsiEngine)
+
+    try:
+        with engine.begin() as connection:
+            pruneMarketData(connection, MARKET_DATA_RETENTION_DAYS)
+    except exc.SQLAlchemyError as e:
+        logging.error("Failed to prune market data: %s", e)
 
 if __name__ == '__main__':
-    storeAllEURQuotes()
-    storePortfolioBalance()
\ No newline at end of file
+    argparse.ArgumentParser(description="Store the current EUR quotes and the portfolio balance",
+                            parents=[commonParser]).parse_args()
+    runDataCollection()
+    storeRunMetrics(engine, 'data collection')
+
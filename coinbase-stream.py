@@ -0,0 +1,187 @@
+from common_functions import *
+import asyncio
+import importlib
+import signal
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+from rsi_engine import toLocalNaive
+
+# Public market data feed; COINBASE_WS_URL points the stream at another server, e.g. fake_coinbase.py --ws-port
+COINBASE_WS_URL = os.getenv('COINBASE_WS_URL', 'wss://advanced-trade-ws.coinbase.com')
+STREAM_BAR_INTERVAL = os.getenv('STREAM_BAR_INTERVAL', '1min')
+STREAM_FLUSH_SECONDS = float(os.getenv('STREAM_FLUSH_SECONDS', '5'))
+STREAM_SUBSCRIBE_BATCH = 100  # product ids per subscribe message
+STREAM_MAX_RECONNECT_DELAY = 60
+
+# The loader's RSI engine, so streamed bars continue the same rsi_state
+dataLoader = importlib.import_module('coinbase-load-data')
+
+def parseStreamArguments():
+    parser = argparse.ArgumentParser(description="Stream Coinbase tickers for all EUR pairs into market_data",
+                                     parents=[commonParser])
+    parser.add_argument('--url', default=COINBASE_WS_URL, help='WebSocket URL of the market data feed')
+    parser.add_argument('--bar-interval', default=STREAM_BAR_INTERVAL, help='Bar length of the stored prices, e.g. 1min')
+    parser.add_argument('--flush-seconds', type=float, default=STREAM_FLUSH_SECONDS, help='Time between writes of closed bars')
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds (default: run until SIGTERM)')
+    return parser.parse_args()
+
+
+class BarAggregator:
+    # Last price per symbol and bar. A bar is closed by the first tick of a later bar or, for quiet symbols,
+    # once its interval plus `grace` has passed; ticks for bars that were already closed are dropped.
+    def __init__(self, interval, grace=timedelta(seconds=2)):
+        self.interval = pd.Timedelta(interval)
+        self.grace = grace
+        self.open = {}
+        self.closedUntil = {}
+        self.closed = []
+
+    def add(self, symbol, timestamp, price):
+        bar_time = timestamp.floor(self.interval)
+        if symbol in self.closedUntil and bar_time <= self.closedUntil[symbol]:
+            return
+
+        bar = self.open.get(symbol)
+        if bar is None or bar_time > bar[0]:
+            if bar is not None:
+                self.close(symbol, bar)
+            self.open[symbol] = [bar_time, price]
+        elif bar_time == bar[0]:
+            bar[1] = price
+
+    def close(self, symbol, bar):
+        self.closed.append((symbol, bar[1], bar[0]))
+        self.closedUntil[symbol] = bar[0]
+
+    def drain(self, now):
+        # Closed bars as (symbol, close, bar_time), oldest first per symbol
+        cutoff = (now - self.grace).floor(self.interval)
+        for symbol, bar in list(self.open.items()):
+            if bar[0] < cutoff:
+                self.close(symbol, bar)
+                del self.open[symbol]
+
+        closed, self.closed = self.closed, []
+        return closed
+
+
+class TickerStream:
+    def __init__(self, url=COINBASE_WS_URL, bar_interval=STREAM_BAR_INTERVAL, flush_seconds=STREAM_FLUSH_SECONDS):
+        self.url = url
+        self.flushSeconds = flush_seconds
+        self.bars = BarAggregator(bar_interval)
+        self.symbols = {}
+        self.stopping = None
+        self.stats = {'connections': 0, 'messages': 0, 'ticks': 0, 'bars': 0}
+
+    def loadProducts(self):
+        # A fresh listing on every (re)connect picks up newly listed EUR pairs
+        self.symbols = {p['product_id']: p['base_currency_id'] for p in getAllEURQuotes(getMarketSnapshot(refresh=True))}
+        return sorted(self.symbols)
+
+    async def subscribe(self, websocket, product_ids):
+        for start in range(0, len(product_ids), STREAM_SUBSCRIBE_BATCH):
+            await websocket.send(json.dumps({'type': 'subscribe', 'channel': 'ticker',
+                                             'product_ids': product_ids[start:start + STREAM_SUBSCRIBE_BATCH]}))
+        # Heartbeats keep the connection open while no ticker changes
+        await websocket.send(json.dumps({'type': 'subscribe', 'channel': 'heartbeats'}))
+
+    def handleMessage(self, raw):
+        message = json.loads(raw)
+        if message.get('channel') != 'ticker':
+            if message.get('type') == 'error':
+                logging.error("Ticker stream error: %s", message.get('message'))
+            return
+
+        self.stats['messages'] += 1
+        timestamp = toLocalNaive(message['timestamp'])
+        for event in message.get('events', ()):
+            for ticker in event.get('tickers', ()):
+                symbol = self.symbols.get(ticker.get('product_id'))
+                if symbol and ticker.get('price'):
+                    self.bars.add(symbol, timestamp, float(ticker['price']))
+                    self.stats['ticks'] += 1
+
+    async def consume(self):
+        delay = 1
+        while not self.stopping.is_set():
+            try:
+                productIds = await asyncio.to_thread(self.loadProducts)
+                async with connect(self.url, max_size=None) as websocket:
+                    await self.subscribe(websocket, productIds)
+                    self.stats['connections'] += 1
+                    logging.info("Ticker stream connected to %s, subscribed to %d EUR pairs", self.url, len(productIds))
+                    delay = 1
+                    async for raw in websocket:
+                        self.handleMessage(raw)
+                logging.warning("Ticker stream closed by the server, reconnecting")
+            except (ConnectionClosed, OSError, asyncio.TimeoutError) as e:
+                logging.warning("Ticker stream disconnected: %s, reconnecting in %ds", e, delay)
+            except Exception as e:
+                logging.exception("Ticker stream failed: %s, reconnecting in %ds", e, delay)
+
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, STREAM_MAX_RECONNECT_DELAY)
+
+    def storeBars(self, bars):
+        # Same rows as a loader run: price and RSI per bar in market_data, the latest of them in market_analysis
+        rsiEngine = dataLoader.rsiEngine
+        dataLoader.prepareRsiEngine({symbol for symbol, _, _ in bars})
+
+        timestamp = pd.to_datetime('now')
+        rows = []
+        latest = {}
+        for symbol, price, bar_time in sorted(bars, key=lambda bar: bar[2]):
+            rsi = rsiEngine.update(symbol, bar_time, price)
+            rows.append((symbol, price, bar_time, rsi))
+            if rsi is not None:
+                latest[symbol] = (symbol, price, rsi, rsiEngine.states[symbol].bar_time, timestamp)
+
+        stored = storeIngestionBatch(rows, skip_duplicates=SKIP_DUPLICATES, analysis_rows=list(latest.values()),
+                                     rsi_engine=rsiEngine)
+        self.stats['bars'] += stored
+        logging.debug("Stored %d streamed bars, stream stats %s", stored, self.stats)
+
+    async def flush(self):
+        bars = self.bars.drain(toLocalNaive(pd.Timestamp.now(tz='UTC')))
+        if bars:
+            await asyncio.to_thread(self.storeBars, bars)
+
+    async def flushPeriodically(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.flushSeconds)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.exception("Failed to flush streamed bars: %s", e)
+
+    async def run(self, duration=None):
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+        if duration:
+            loop.call_later(duration, self.stopping.set)
+
+        consumer = asyncio.create_task(self.consume())
+        flusher = asyncio.create_task(self.flushPeriodically())
+        await self.stopping.wait()
+
+        # Bars still open at shutdown are not stored; their interval has not ended yet
+        consumer.cancel()
+        await asyncio.gather(consumer, flusher, return_exceptions=True)
+        logging.info("Ticker stream stopped: %s", self.stats)
+        return self.stats
+
+if __name__ == '__main__':
+    streamArgs = parseStreamArguments()
+    stream = TickerStream(streamArgs.url, streamArgs.bar_interval, streamArgs.flush_seconds)
+    print(asyncio.run(stream.run(streamArgs.duration)))
+    apiClient.close()
+    engine.dispose()
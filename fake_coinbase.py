@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+CANDLE_SECONDS = {'ONE_MINUTE': 60, 'FIVE_MINUTE': 300, 'FIFTEEN_MINUTE': 900, 'THIRTY_MINUTE': 1800,
+                  'ONE_HOUR': 3600, 'TWO_HOUR': 7200, 'SIX_HOUR': 21600, 'ONE_DAY': 86400}
+
+
+class FakeCoinbase:
+    # Local stand-in for the /api/v3/brokerage endpoints the bot uses. Tokens are not verified; every response
+    # can be delayed by `latency` seconds and a `rate_limit_ratio` share of them is answered with a 429.
+    def __init__(self, symbols=250, holdings=20, latency=0.0, rate_limit_ratio=0.0, retry_after=0.1,
+                 seed=42, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.rateLimited = 0
+
+        self.products = {}
+        for n in range(symbols):
+            base = f"C{n:03d}"
+            self.products[f"{base}-EUR"] = {
+                'product_id': f"{base}-EUR",
+                'base_currency_id': base,
+                'quote_currency_id': 'EUR',
+                'price': f"{self.random.uniform(0.01, 1000):.8f}",
+                'base_increment': '0.00000001',
+                'quote_increment': '0.01',
+                'base_min_size': '0.00000001',
+                'base_max_size': '100000000',
+                'quote_min_size': '1',
+                'quote_max_size': '1000000',
+                'status': 'online',
+            }
+
+        self.accounts = [self.account('EUR', '1000')]
+        for product in list(self.products.values())[:holdings]:
+            self.accounts.append(self.account(product['base_currency_id'], f"{self.random.uniform(0.1, 10):.8f}"))
+        self.orders = {}
+
+        self.server = ThreadingHTTPServer((host, port), self.handlerClass())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def account(self, currency, balance):
+        return {
+            'uuid': str(uuid.uuid4()),
+            'currency': currency,
+            'available_balance': {'value': balance, 'currency': currency},
+            'retail_portfolio_id': 'fake-portfolio',
+        }
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'rate_limited': self.rateLimited}
+
+    def tick(self):
+        # Every listing moves the prices a little, so consecutive collection runs see changing quotes
+        for product in self.products.values():
+            product['price'] = f"{float(product['price']) * self.random.uniform(0.99, 1.01):.8f}"
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path == '/api/v3/brokerage/market/products':
+            self.tick()
+            return 200, {'products': list(self.products.values()), 'num_products': len(self.products)}
+
+        match = re.fullmatch(r'/api/v3/brokerage/products/([^/]+)/candles', path)
+        if method == 'GET' and match:
+            product = self.products.get(match.group(1))
+            if not product:
+                return 404, {'error': 'NOT_FOUND', 'message': 'product not found'}
+            return self.candles(product, query)
+
+        match = re.fullmatch(r'/api/v3/brokerage/products/([^/]+)', path)
+        if method == 'GET' and match:
+            product = self.products.get(match.group(1))
+            return (200, product) if product else (404, {'error': 'NOT_FOUND', 'message': 'product not found'})
+
+        if method == 'GET' and path == '/api/v3/brokerage/accounts':
+            limit = int(query.get('limit', ['49'])[0])
+            start = int(query.get('cursor', ['0'])[0] or 0)
+            page = self.accounts[start:start + limit]
+            hasNext = start + limit < len(self.accounts)
+            return 200, {'accounts': page, 'has_next': hasNext, 'cursor': str(start + limit) if hasNext else '', 'size': len(page)}
+
+        if method == 'GET' and re.fullmatch(r'/api/v3/brokerage/portfolios/[^/]+', path):
+            total = sum(float(a['available_balance']['value']) * float(self.products.get(f"{a['currency']}-EUR", {}).get('price', 1))
+                        for a in self.accounts)
+            return 200, {'breakdown': {'portfolio_balances': {'total_balance': {'value': f"{total:.2f}", 'currency': 'EUR'}}}}
+
+        if method == 'POST' and path == '/api/v3/brokerage/orders':
+            order = json.loads(body or '{}')
+            product = self.products.get(order.get('product_id'))
+            if not product:
+                return 200, {'success': False, 'error_response': {'error': 'UNKNOWN_PRODUCT', 'message': 'unknown product'}}
+
+            configuration = order.get('order_configuration', {}).get('market_market_ioc', {})
+            price = float(product['price'])
+            if 'base_size' in configuration:
+                size = float(configuration['base_size'])
+                value = size * price
+            else:
+                value = float(configuration.get('quote_size', 0))
+                size = value / price
+
+            orderId = str(uuid.uuid4())
+            self.orders[orderId] = {
+                'order_id': orderId,
+                'product_id': product['product_id'],
+                'side': order.get('side'),
+                'client_order_id': order.get('client_order_id'),
+                'status': 'FILLED',
+                'filled_size': f"{size:.8f}",
+                'filled_value': f"{value:.2f}",
+                'average_filled_price': product['price'],
+            }
+            return 200, {'success': True, 'success_response': {'order_id': orderId, 'product_id': product['product_id'],
+                                                                'side': order.get('side'), 'client_order_id': order.get('client_order_id')}}
+
+        match = re.fullmatch(r'/api/v3/brokerage/orders/historical/([^/]+)', path)
+        if method == 'GET' and match:
+            order = self.orders.get(match.group(1))
+            return (200, {'order': order}) if order else (404, {'error': 'NOT_FOUND', 'message': 'order not found'})
+
+        return 404, {'error': 'NOT_FOUND', 'message': f"no fake for {method} {path}"}
+
+    def candles(self, product, query):
+        # Newest first like the real endpoint; each price is a deterministic walk around the product's price,
+        # so repeated requests for a range return the same candles
+        seconds = CANDLE_SECONDS.get(query.get('granularity', [''])[0])
+        if seconds is None:
+            return 400, {'error': 'INVALID_ARGUMENT', 'message': 'unknown granularity'}
+        start = int(query.get('start', ['0'])[0]) // seconds * seconds
+        end = int(query.get('end', ['0'])[0])
+        if (end - start) // seconds >= 350:
+            return 400, {'error': 'INVALID_ARGUMENT', 'message': 'number of candles requested should be less than 350'}
+
+        candles = []
+        base = float(product['price'])
+        for candleStart in range(start, end + 1, seconds):
+            walk = random.Random(f"{product['product_id']}:{candleStart}")
+            close = base * walk.uniform(0.95, 1.05)
+            candles.append({'start': str(candleStart), 'low': f"{close * 0.99:.8f}", 'high': f"{close * 1.01:.8f}",
+                            'open': f"{close * walk.uniform(0.99, 1.01):.8f}", 'close': f"{close:.8f}",
+                            'volume': f"{walk.uniform(1, 1000):.8f}"})
+        return 200, {'candles': candles[::-1]}
+
+    def handlerClass(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API, so the client's pool is exercised
+            disable_nagle_algorithm = True  # headers and body are separate writes; Nagle would add ~40ms to each
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status, data, headers=None):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def handle_request(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else None
+                parts = urlsplit(self.path)
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                with fake.lock:
+                    fake.requests[f"{method} {re.sub(r'/[0-9a-f-]{36}$|/[A-Z0-9]+-EUR(?=/candles$|$)', '/{id}', parts.path)}"] += 1
+                    limited = fake.random.random() < fake.rate_limit_ratio
+                    if limited:
+                        fake.rateLimited += 1
+                    else:
+                        status, data = fake.route(method, parts.path, parse_qs(parts.query), body)
+
+                if limited:
+                    self.respond(429, {'error': 'RATE_LIMIT_EXCEEDED', 'message': 'Too many requests'},
+                                 {'Retry-After': str(fake.retry_after)})
+                else:
+                    self.respond(status, data)
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+        return Handler
+
+
+class FakeTickerFeed:
+    # WebSocket ticker channel for the products of a FakeCoinbase: every `tick_interval` seconds the subscribed
+    # products get a ticker message. After `disconnect_after` messages the server drops the connection, so
+    # clients have to reconnect and subscribe again.
+    def __init__(self, api, tick_interval=0.1, disconnect_after=None, host='127.0.0.1', port=0):
+        self.api = api
+        self.tick_interval = tick_interval
+        self.disconnect_after = disconnect_after
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.subscriptions = 0
+        self.sent = 0
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def tickers(self, product_ids):
+        with self.api.lock:
+            self.api.tick()
+            return [{'type': 'ticker', 'product_id': productId, 'price': self.api.products[productId]['price']}
+                    for productId in sorted(product_ids) if productId in self.api.products]
+
+    async def handler(self, websocket):
+        self.connections += 1
+        subscribed = set()
+
+        async def receive():
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message.get('type') == 'subscribe' and message.get('channel') == 'ticker':
+                    subscribed.update(message.get('product_ids', ()))
+                    self.subscriptions += 1
+
+        receiver = asyncio.create_task(receive())
+        sequence = 0
+        try:
+            while True:
+                await asyncio.sleep(self.tick_interval)
+                if not subscribed:
+                    continue
+                await websocket.send(json.dumps({
+                    'channel': 'ticker',
+                    'client_id': '',
+                    'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+                    'sequence_num': sequence,
+                    'events': [{'type': 'snapshot' if sequence == 0 else 'update', 'tickers': self.tickers(subscribed)}],
+                }))
+                sequence += 1
+                self.sent += 1
+                if self.disconnect_after and sequence >= self.disconnect_after:
+                    await websocket.close(1011, 'fake disconnect')
+                    return
+        except ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+
+    async def serve(self, ready):
+        self.stopped = asyncio.Event()
+        async with serve(self.handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            await self.stopped.wait()
+
+    def start(self):
+        ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self.serve(ready),), daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake Coinbase Advanced Trade API for benchmarks")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--symbols', type=int, default=250, help='Number of EUR products')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--ws-port', type=int, help='Also serve the WebSocket ticker channel on this port')
+    parser.add_argument('--tick-interval', type=float, default=1.0, help='Seconds between ticker messages')
+    parser.add_argument('--disconnect-after', type=int, help='Drop WebSocket connections after this many messages')
+    fakeArgs = parser.parse_args()
+
+    fake = FakeCoinbase(symbols=fakeArgs.symbols, latency=fakeArgs.latency, rate_limit_ratio=fakeArgs.rate_limit_ratio,
+                        port=fakeArgs.port)
+    print(f"Fake Coinbase API on {fake.url}, point the bot at it with COINBASE_API_URL={fake.url}")
+    if fakeArgs.ws_port is not None:
+        feed = FakeTickerFeed(fake, tick_interval=fakeArgs.tick_interval, disconnect_after=fakeArgs.disconnect_after,
+                              port=fakeArgs.ws_port)
+        print(f"Fake ticker feed on {feed.start()}, point the stream at it with COINBASE_WS_URL={feed.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
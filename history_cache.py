@@ -0,0 +1,162 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+HISTORY_CACHE_PATH = os.getenv('HISTORY_CACHE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'trading-bot', 'history'))
+HISTORY_SYNC_BATCH = int(os.getenv('HISTORY_SYNC_BATCH', '500000'))
+# Ids are taken at insert time, not at commit, so a writer's transaction can commit rows below ids that were already
+# synced. Every sync reads this many ids below the watermark again; merge() drops the rows it already has by id.
+HISTORY_SYNC_OVERLAP = int(os.getenv('HISTORY_SYNC_OVERLAP', '100000'))
+# Day files of an older format are dropped and synced again
+HISTORY_CACHE_FORMAT = 2
+
+
+class HistoryCache:
+    # Raw market_data ticks as one uncompressed Arrow IPC file per UTC day, rows sorted by symbol and timestamp.
+    # Files are memory mapped on read, so prices come back as float64 columns without a per row conversion.
+    def __init__(self, path=HISTORY_CACHE_PATH):
+        self.path = path
+        self.statePath = os.path.join(path, 'state.json')
+        self.state = self.loadState()
+
+    def loadState(self):
+        try:
+            with open(self.statePath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'format': HISTORY_CACHE_FORMAT, 'last_id': 0}
+
+    def reset(self):
+        for name in os.listdir(self.path) if os.path.isdir(self.path) else ():
+            if name.startswith('day=') and name.endswith('.arrow'):
+                os.remove(os.path.join(self.path, name))
+        self.state = {'format': HISTORY_CACHE_FORMAT, 'last_id': 0}
+        self.saveState()
+
+    def saveState(self):
+        self.writeAtomically(self.statePath, lambda f: f.write(json.dumps(self.state).encode()))
+
+    def writeAtomically(self, path, write):
+        os.makedirs(self.path, exist_ok=True)
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        os.replace(tmpPath, path)
+
+    def dayPath(self, day):
+        return os.path.join(self.path, f"day={day:%Y-%m-%d}.arrow")
+
+    def schema(self):
+        return pa.schema([('id', pa.int64()), ('symbol', pa.string()), ('price', pa.float64()),
+                          ('timestamp', pa.timestamp('ns', tz='UTC'))])
+
+    def readDay(self, path):
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def writeDay(self, path, frame):
+        table = pa.Table.from_pandas(frame, schema=self.schema(), preserve_index=False)
+
+        def write(f):
+            with pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+
+        self.writeAtomically(path, write)
+
+    def merge(self, ticks):
+        # Late rows (backfills) land in older days, so every day in the batch is merged with what is on disk.
+        # Rows read again by the sync overlap, or after a crash before saveState(), are already there: one per id.
+        ticks = ticks[['id', 'symbol', 'price', 'timestamp']].assign(timestamp=pd.to_datetime(ticks['timestamp'], utc=True))
+        added = 0
+        for day, rows in ticks.groupby(ticks['timestamp'].dt.floor('D')):
+            path = self.dayPath(day)
+            existing = self.readDay(path).to_pandas() if os.path.exists(path) else rows.iloc[:0]
+            rows = pd.concat([existing, rows], ignore_index=True).drop_duplicates('id', keep='last')
+            added += len(rows) - len(existing)
+            self.writeDay(path, rows.sort_values(['symbol', 'timestamp'], kind='stable'))
+        return added
+
+    def sync(self, engine, batch_size=HISTORY_SYNC_BATCH, overlap=HISTORY_SYNC_OVERLAP):
+        # Only the new tail and the overlap below the last synced id are read, so a sync costs Postgres little
+        if pa is None:
+            raise RuntimeError("The history cache needs pyarrow: pip install pyarrow")
+        if self.state.get('format') != HISTORY_CACHE_FORMAT:
+            self.reset()
+
+        query = text("""
+        SELECT id, symbol, price::float8 AS price, timestamp
+        FROM market_data
+        WHERE id > :last_id
+        AND price IS NOT NULL
+        ORDER BY id
+        LIMIT :limit
+        """)
+
+        synced = 0
+        cursor = max(0, self.state['last_id'] - overlap)
+        while True:
+            with engine.connect() as connection:
+                tail = pd.read_sql_query(query, connection, params={"last_id": cursor, "limit": batch_size})
+            if tail.empty:
+                break
+
+            synced += self.merge(tail)
+            cursor = int(tail['id'].max())
+            self.state['last_id'] = max(self.state['last_id'], cursor)
+            self.saveState()
+
+            if len(tail) < batch_size:
+                break
+
+        logging.info("Synced %d market data rows into the history cache (last id %s)", synced, self.state['last_id'])
+        return synced
+
+    def load(self, days, symbols=None, now=None):
+        # Same shape as the market_data queries: symbol, price (float64) and timestamp (UTC), oldest first per symbol
+        if pa is None:
+            raise RuntimeError("The history cache needs pyarrow: pip install pyarrow")
+
+        now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now).tz_convert('UTC')
+        since = now - pd.Timedelta(days=days)
+
+        tables = [self.readDay(self.dayPath(day)) for day in pd.date_range(since.floor('D'), now.floor('D'), freq='D')
+                  if os.path.exists(self.dayPath(day))]
+        if not tables:
+            return pd.DataFrame({'symbol': pd.Series(dtype=object), 'price': pd.Series(dtype=float),
+                                 'timestamp': pd.Series(dtype='datetime64[ns, UTC]')})
+
+        table = pa.concat_tables(tables)
+        mask = pc.greater_equal(table['timestamp'], pa.scalar(since.value, type=pa.timestamp('ns', tz='UTC')))
+        if symbols:
+            mask = pc.and_(mask, pc.is_in(table['symbol'], value_set=pa.array(list(symbols), type=pa.string())))
+        return table.filter(mask).select(['symbol', 'price', 'timestamp']).to_pandas()
+
+
+# Shared by the backtester and the sweep
+historyCache = HistoryCache()
+
+if __name__ == '__main__':
+    from common_functions import commonParser, engine
+
+    parser = argparse.ArgumentParser(description="Sync market_data into the local history cache", parents=[commonParser])
+    parser.add_argument('--days', type=int, default=30, help='Days of history to load after the sync, to time the read')
+    cacheArgs = parser.parse_args()
+
+    started = time.perf_counter()
+    print(f"Synced {historyCache.sync(engine)} rows in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    ticks = historyCache.load(cacheArgs.days)
+    print(f"Loaded {len(ticks)} ticks of {ticks['symbol'].nunique()} symbols over {cacheArgs.days} days "
+          f"in {(time.perf_counter() - started) * 1000:.1f}ms")
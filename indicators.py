@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+from common_functions import RSI_INTERVAL, RSI_PERIODS, fetchMarketDataOfLastDays
+
+INDICATOR_INTERVALS = ['15min', '1h', '4h']
+SMA_PERIODS = 20
+
+def resampleToPriceMatrix(ticks, interval=RSI_INTERVAL):
+    # Wide frame (bar x symbol) holding the last price of every bar, like resampleData's 'last'
+    buckets = ticks['timestamp'].dt.floor(interval)
+    prices = ticks.groupby([buckets, ticks['symbol']])['price'].last().unstack('symbol')
+    return prices.reindex(pd.date_range(prices.index.min(), prices.index.max(), freq=interval))
+
+def calculateRsiMatrix(prices, periods=RSI_PERIODS):
+    # calculateRsi for every column at once; empty bars are skipped exactly like calculateRsi's dropna()
+    valid = prices.notna()
+    delta = prices - prices.ffill().shift(1)
+    first = valid & delta.isna()
+
+    gain = delta.clip(lower=0).mask(first, 0.0)
+    loss = (-delta).clip(lower=0).mask(first, 0.0)
+
+    avg_gain = gain.ewm(span=periods, adjust=False, ignore_na=True).mean()
+    avg_loss = loss.ewm(span=periods, adjust=False, ignore_na=True).mean()
+
+    rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+    ready = valid & (valid.cumsum() >= periods) & rsi.notna()
+    return rsi.where(ready)
+
+def latestSma(values, periods=SMA_PERIODS):
+    # Mean of the last `periods` non-empty bars of every column, NaN while a column has fewer bars
+    valid = ~np.isnan(values)
+    fromEnd = valid[::-1].cumsum(axis=0)[::-1]
+    window = valid & (fromEnd <= periods)
+    sma = np.where(window, values, 0.0).sum(axis=0) / periods
+    return np.where(valid.sum(axis=0) >= periods, sma, np.nan)
+
+def computeIndicators(ticks, intervals=INDICATOR_INTERVALS, rsi_periods=RSI_PERIODS, sma_periods=SMA_PERIODS):
+    # One row per (symbol, interval) with the last bar's time and price, RSI, SMA and number of non-empty bars.
+    # The ticks are bucketed once at the finest interval; coarser bars are the last non-empty finer bar inside them.
+    intervals = sorted(intervals, key=pd.Timedelta)
+    finest = pd.Timedelta(intervals[0])
+    base = resampleToPriceMatrix(ticks, interval=finest)
+
+    tables = []
+    for interval in intervals:
+        if pd.Timedelta(interval) == finest:
+            prices = base
+        elif pd.Timedelta(interval) % finest == pd.Timedelta(0):
+            prices = base.resample(interval).last()
+        else:
+            prices = resampleToPriceMatrix(ticks, interval=interval)
+
+        values = prices.to_numpy(dtype=float)
+        rsi = calculateRsiMatrix(prices, periods=rsi_periods).to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        last = len(values) - 1 - valid[::-1].argmax(axis=0)
+        columns = np.arange(values.shape[1])
+
+        table = pd.DataFrame({
+            'symbol': prices.columns,
+            'interval': interval,
+            'bar_time': prices.index[last],
+            'price': values[last, columns],
+            'rsi': rsi[last, columns],
+            'sma': latestSma(values, periods=sma_periods),
+            'bars': valid.sum(axis=0),
+        })
+        tables.append(table[valid.any(axis=0)])
+
+    return pd.concat(tables, ignore_index=True).set_index(['symbol', 'interval']).sort_index()
+
+def indicatorColumns(indicators):
+    # One row per symbol with rsi_<interval>, sma_<interval> and bars_<interval> columns and the latest price
+    if indicators.empty:
+        return pd.DataFrame(columns=['price'], index=pd.Index([], name='symbol'))
+
+    wide = indicators[['rsi', 'sma', 'bars']].unstack('interval')
+    wide.columns = [f"{name}_{interval}" for name, interval in wide.columns]
+
+    finest = min(indicators.index.unique('interval'), key=pd.Timedelta)
+    wide['price'] = indicators.xs(finest, level='interval')['price']
+    return wide
+
+def filterSymbols(indicators, expression):
+    # e.g. "rsi_1h < 30 and price > sma_4h"; rows with a NaN indicator never match a comparison
+    if indicators.empty:
+        return []
+    return indicatorColumns(indicators).query(expression).index.tolist()
+
+def loadIndicators(symbols, intervals=INDICATOR_INTERVALS, days=7, rsi_periods=RSI_PERIODS, sma_periods=SMA_PERIODS):
+    finest = min(intervals, key=pd.Timedelta)
+    ticks = fetchMarketDataOfLastDays(symbols, days=days, interval=finest)
+    if ticks.empty:
+        return pd.DataFrame(columns=['bar_time', 'price', 'rsi', 'sma', 'bars'],
+                            index=pd.MultiIndex.from_arrays([[], []], names=['symbol', 'interval']))
+    return computeIndicators(ticks, intervals=intervals, rsi_periods=rsi_periods, sma_periods=sma_periods)
@@ -0,0 +1,191 @@
+import argparse
+import logging
+import os
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+# Raw ticks older than this many days are deleted once they are rolled up; 0 keeps them forever
+MARKET_DATA_RETENTION_DAYS = int(os.getenv('MARKET_DATA_RETENTION_DAYS', '30'))
+
+# Rollup table per bucket size, finest first
+ROLLUP_TABLES = [
+    (pd.Timedelta('1h'), 'market_data_hourly'),
+    (pd.Timedelta('1d'), 'market_data_daily'),
+]
+
+# Repeated quotes for the same symbol and timestamp, keeping the first row; run before the unique index is created
+DEDUPLICATE_MARKET_DATA = """
+DELETE FROM market_data duplicate
+USING market_data original
+WHERE duplicate.symbol = original.symbol AND duplicate.timestamp = original.timestamp AND duplicate.id > original.id
+"""
+
+SCHEMA = [
+    # Unique, so it also serves ON CONFLICT (symbol, timestamp) for --skip-duplicates
+    "CREATE UNIQUE INDEX IF NOT EXISTS market_data_symbol_timestamp_key ON market_data (symbol, timestamp)",
+    "DROP INDEX IF EXISTS market_data_symbol_timestamp_idx",
+    "CREATE INDEX IF NOT EXISTS market_data_timestamp_idx ON market_data (timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS market_data_hourly (
+        symbol VARCHAR(10) NOT NULL,
+        bucket TIMESTAMPTZ NOT NULL,
+        open DECIMAL NOT NULL,
+        high DECIMAL NOT NULL,
+        low DECIMAL NOT NULL,
+        close DECIMAL NOT NULL,
+        samples INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (symbol, bucket)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS market_data_daily (
+        symbol VARCHAR(10) NOT NULL,
+        bucket TIMESTAMPTZ NOT NULL,
+        open DECIMAL NOT NULL,
+        high DECIMAL NOT NULL,
+        low DECIMAL NOT NULL,
+        close DECIMAL NOT NULL,
+        samples INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (symbol, bucket)
+    )
+    """,
+]
+
+# Hourly buckets are recomputed from the raw ticks, daily buckets from the hourly ones. Recomputing whole buckets
+# keeps the upserts idempotent, so duplicate or late ticks never double count.
+HOURLY_ROLLUP = """
+INSERT INTO market_data_hourly (symbol, bucket, open, high, low, close, samples, updated_at)
+SELECT symbol, date_trunc('hour', timestamp),
+       (array_agg(price ORDER BY timestamp))[1], max(price), min(price),
+       (array_agg(price ORDER BY timestamp DESC))[1], count(*), CURRENT_TIMESTAMP
+FROM market_data
+WHERE timestamp >= date_trunc('hour', CAST(:since AS timestamptz))
+AND timestamp < date_trunc('hour', CAST(:until AS timestamptz)) + interval '1 hour'
+AND price IS NOT NULL
+{symbols}
+GROUP BY 1, 2
+ON CONFLICT (symbol, bucket) DO UPDATE SET
+    open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+    samples = EXCLUDED.samples, updated_at = EXCLUDED.updated_at
+"""
+
+DAILY_ROLLUP = """
+INSERT INTO market_data_daily (symbol, bucket, open, high, low, close, samples, updated_at)
+SELECT symbol, date_trunc('day', bucket),
+       (array_agg(open ORDER BY bucket))[1], max(high), min(low),
+       (array_agg(close ORDER BY bucket DESC))[1], sum(samples), CURRENT_TIMESTAMP
+FROM market_data_hourly
+WHERE bucket >= date_trunc('day', CAST(:since AS timestamptz))
+AND bucket < date_trunc('day', CAST(:until AS timestamptz)) + interval '1 day'
+{symbols}
+GROUP BY 1, 2
+ON CONFLICT (symbol, bucket) DO UPDATE SET
+    open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+    samples = EXCLUDED.samples, updated_at = EXCLUDED.updated_at
+"""
+
+# False until a check finds the rollup tables; a negative result is re-checked on every call, so tables created by
+# --setup while a daemon runs are used from its next check on
+rollupTablesReady = False
+rollupTablesMissingLogged = False
+
+def rollupsAvailable(connection):
+    global rollupTablesReady, rollupTablesMissingLogged
+    if not rollupTablesReady:
+        rollupTablesReady = bool(connection.execute(text(
+            "SELECT to_regclass('market_data_hourly') IS NOT NULL AND to_regclass('market_data_daily') IS NOT NULL"
+        )).scalar())
+        if not rollupTablesReady and not rollupTablesMissingLogged:
+            rollupTablesMissingLogged = True
+            logging.info("No market data rollup tables, reading raw market_data (see market_storage.py --setup)")
+    return rollupTablesReady
+
+def rollupTableFor(intervals):
+    # The coarsest rollup every interval is a whole multiple of, or None when only raw ticks will do
+    if isinstance(intervals, (str, pd.Timedelta, timedelta)):
+        intervals = [intervals]
+    intervals = [pd.Timedelta(interval) for interval in intervals]
+
+    table = None
+    for bucket, name in ROLLUP_TABLES:
+        if intervals and all(interval % bucket == pd.Timedelta(0) for interval in intervals):
+            table = name
+    return table
+
+def refreshRollups(connection, since, until, symbols=None):
+    params = {"since": str(since), "until": str(until)}
+    symbolFilter = ""
+    if symbols is not None:
+        symbolFilter = "AND symbol IN :symbols"
+        params["symbols"] = tuple(symbols)
+
+    hourly = connection.execute(text(HOURLY_ROLLUP.format(symbols=symbolFilter)), params).rowcount
+    daily = connection.execute(text(DAILY_ROLLUP.format(symbols=symbolFilter)), params).rowcount
+    logging.debug("Refreshed %s hourly and %s daily buckets between %s and %s", hourly, daily, since, until)
+
+def pruneMarketData(connection, retention_days=MARKET_DATA_RETENTION_DAYS):
+    # Raw ticks are only deleted when the rollups hold them, and whole hours at a time, so an hourly bucket is
+    # never recomputed from a partly pruned hour
+    if not retention_days or not rollupsAvailable(connection):
+        return 0
+
+    deleted = connection.execute(text("""
+    DELETE FROM market_data
+    WHERE timestamp < date_trunc('hour', CURRENT_TIMESTAMP - make_interval(days => :days))
+    """), {"days": int(retention_days)}).rowcount
+    if deleted:
+        logging.info("Pruned %d market data rows older than %s days", deleted, retention_days)
+    return deleted
+
+def createMarketStorage(connection):
+    global rollupTablesReady
+    if connection.execute(text("SELECT to_regclass('market_data_symbol_timestamp_key') IS NULL")).scalar():
+        deleted = connection.execute(text(DEDUPLICATE_MARKET_DATA)).rowcount
+        if deleted:
+            logging.info("Deleted %d duplicate market data rows before creating the unique index", deleted)
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    rollupTablesReady = True
+
+def rebuildRollups(engine, days=None, chunk=timedelta(days=7)):
+    # One transaction per chunk keeps the rebuild of a large table from holding locks for its whole duration
+    with engine.connect() as connection:
+        oldest, newest = connection.execute(text("SELECT min(timestamp), max(timestamp) FROM market_data")).one()
+    if oldest is None:
+        return
+
+    since = pd.Timestamp(oldest)
+    if days is not None:
+        since = max(since, pd.Timestamp(newest) - timedelta(days=days))
+
+    while since <= pd.Timestamp(newest):
+        until = min(since + chunk, pd.Timestamp(newest))
+        with engine.begin() as connection:
+            refreshRollups(connection, since, until)
+        print(f"Rolled up market data from {since} to {until}")
+        since = until + timedelta(hours=1)
+
+if __name__ == '__main__':
+    from common_functions import commonParser, engine
+
+    parser = argparse.ArgumentParser(description="Manage the market_data index, rollup tables and retention",
+                                     parents=[commonParser])
+    parser.add_argument('--setup', action='store_true', help='Create the unique index and the rollup tables')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute the rollups from the raw ticks')
+    parser.add_argument('--days', type=int, help='Only rebuild the last DAYS days')
+    parser.add_argument('--prune', action='store_true', help='Delete raw ticks older than MARKET_DATA_RETENTION_DAYS')
+    storageArgs = parser.parse_args()
+
+    if storageArgs.setup:
+        with engine.begin() as connection:
+            createMarketStorage(connection)
+        print("Created the unique market_data index and rollup tables")
+    if storageArgs.rebuild:
+        rebuildRollups(engine, days=storageArgs.days)
+    if storageArgs.prune:
+        with engine.begin() as connection:
+            print(f"Pruned {pruneMarketData(connection)} market data rows")
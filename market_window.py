@@ -0,0 +1,129 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from common_functions import RSI_INTERVAL, RSI_PERIODS, fetchMarketDataOfLastDays, resampleData
+from rsi_engine import toLocalNaive
+from run_metrics import timed
+
+
+class MarketWindow:
+    # Ring buffer of the last window_days of bars per symbol. Column (bar number % length) holds the bar's last
+    # price, so appending a quote is O(1) and memory stays at symbols x length float64 values.
+    def __init__(self, interval=RSI_INTERVAL, window_days=4):
+        self.interval = pd.Timedelta(interval)
+        self.window_days = window_days
+        self.length = int(pd.Timedelta(days=window_days) / self.interval) + 1  # plus the still forming bar
+        self.rows = {}
+        self.prices = np.full((0, self.length), np.nan)
+        self.head = None
+
+    def barNumber(self, timestamp):
+        return toLocalNaive(timestamp).value // self.interval.value
+
+    def row(self, symbol):
+        if symbol not in self.rows:
+            if len(self.rows) == len(self.prices):
+                grown = np.full((max(16, 2 * len(self.prices)), self.length), np.nan)
+                grown[:len(self.prices)] = self.prices
+                self.prices = grown
+            self.rows[symbol] = len(self.rows)
+        return self.rows[symbol]
+
+    def advance(self, bar):
+        if self.head is None:
+            self.head = bar
+            return
+        if bar <= self.head:
+            return
+
+        # The columns reused for the new bars held the oldest bars, which now leave the window
+        if bar - self.head >= self.length:
+            self.prices[:] = np.nan
+        else:
+            self.prices[:, np.arange(self.head + 1, bar + 1) % self.length] = np.nan
+        self.head = bar
+
+    def append(self, symbol, timestamp, price):
+        # Symbols that were never backfilled are left to ensureBackfilled(), which reads them from market_data
+        if symbol not in self.rows or price is None or pd.isna(price):
+            return
+
+        bar = self.barNumber(timestamp)
+        self.advance(bar)
+        if bar > self.head - self.length:
+            self.prices[self.rows[symbol], bar % self.length] = float(price)
+
+    def ensureBackfilled(self, symbols, now=None):
+        missing = [symbol for symbol in symbols if symbol not in self.rows]
+        if not missing:
+            return
+
+        logging.info("Backfilling market window for %d symbols from market_data", len(missing))
+        for symbol in missing:
+            self.row(symbol)
+
+        marketData = fetchMarketDataOfLastDays(missing, days=self.window_days, interval=self.interval)
+        if marketData.empty:
+            return
+
+        bars = resampleData(marketData, interval=self.interval).dropna(subset=['price'])
+        numbers = np.array([self.barNumber(timestamp) for timestamp in bars['timestamp']])
+        self.advance(max(numbers.max(), self.barNumber(now if now is not None else pd.Timestamp.now())))
+
+        inWindow = numbers > self.head - self.length
+        rows = bars['symbol'].map(self.rows).to_numpy()[inWindow]
+        self.prices[rows, numbers[inWindow] % self.length] = bars['price'].astype(float).to_numpy()[inWindow]
+
+    @timed('analysis')
+    def analyse(self, symbols, rsi_periods=RSI_PERIODS, now=None):
+        # Same result and skip rules as determineAllCurrencyAnalysis(resampleData(...)), read straight from the buffer
+        self.advance(self.barNumber(now if now is not None else pd.Timestamp.now()))
+        symbols = [symbol for symbol in symbols if symbol in self.rows]
+        if not symbols or self.head is None:
+            return {}
+
+        order = np.arange(self.head - self.length + 1, self.head + 1) % self.length
+        prices = self.prices[[self.rows[symbol] for symbol in symbols]][:, order]
+
+        alpha = 2 / (rsi_periods + 1)
+        avg_gain = np.zeros(len(symbols))
+        avg_loss = np.zeros(len(symbols))
+        last = np.full(len(symbols), np.nan)
+
+        # One vectorized EWM step per bar across all symbols; empty bars are skipped like calculateRsi's dropna()
+        for column in prices.T:
+            hasPrevious = ~np.isnan(column) & ~np.isnan(last)
+            delta = np.where(hasPrevious, column - last, 0.0)
+            avg_gain = np.where(hasPrevious, alpha * np.maximum(delta, 0) + (1 - alpha) * avg_gain, avg_gain)
+            avg_loss = np.where(hasPrevious, alpha * np.maximum(-delta, 0) + (1 - alpha) * avg_loss, avg_loss)
+            last = np.where(np.isnan(column), last, column)
+
+        valid = ~np.isnan(prices)
+        first = valid.argmax(axis=1)
+        bars = np.where(valid.any(axis=1), self.length - valid[:, ::-1].argmax(axis=1) - first, 0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+
+        analysis = {}
+        for symbol, symbolBars, currentPrice, symbolRsi in zip(symbols, bars, last, rsi):
+            if symbolBars < rsi_periods:
+                print(f"Skipping {symbol} due to insufficient data")
+                continue
+
+            if np.isnan(currentPrice) or np.isnan(symbolRsi):
+                print(f"Skipping {symbol} due to NaN values")
+                continue
+
+            analysis[symbol] = {
+                'currentPrice': float(currentPrice),
+                'rsi': float(symbolRsi)
+            }
+
+        return analysis
+
+
+# Shared by the loader, which appends new quotes, and the trading bot, which reads it
+marketWindow = MarketWindow()
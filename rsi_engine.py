@@ -0,0 +1,245 @@
+import logging
+import math
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import exc, text
+
+from common_functions import engine, executeValues, fetchMarketDataOfLastDays, resampleData
+
+
+def toLocalNaive(timestamp):
+    # market_data returns timezone aware timestamps, the loader uses naive local time
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+    return timestamp
+
+
+class RsiState:
+    # EWM state after the latest bar plus the state before it, so the still forming bar can be replaced in O(1)
+    def __init__(self, bar_time, close, avg_gain=0.0, avg_loss=0.0, bars=1,
+                 prev_close=None, prev_avg_gain=0.0, prev_avg_loss=0.0):
+        self.bar_time = toLocalNaive(bar_time)
+        self.close = float(close)
+        self.avg_gain = float(avg_gain)
+        self.avg_loss = float(avg_loss)
+        self.bars = int(bars)
+        self.prev_close = None if prev_close is None or pd.isna(prev_close) else float(prev_close)
+        self.prev_avg_gain = float(prev_avg_gain)
+        self.prev_avg_loss = float(prev_avg_loss)
+
+    def apply(self, close, alpha):
+        self.close = float(close)
+        if self.prev_close is None:
+            # First bar of the series: calculateRsi sees a NaN delta there, which counts as zero gain and loss
+            self.avg_gain = 0.0
+            self.avg_loss = 0.0
+            return
+
+        delta = self.close - self.prev_close
+        self.avg_gain = alpha * max(delta, 0.0) + (1 - alpha) * self.prev_avg_gain
+        self.avg_loss = alpha * max(-delta, 0.0) + (1 - alpha) * self.prev_avg_loss
+
+    @property
+    def rsi(self):
+        if self.avg_loss == 0:
+            return 100.0 if self.avg_gain > 0 else math.nan
+        return 100 - (100 / (1 + self.avg_gain / self.avg_loss))
+
+
+class IncrementalRsi:
+    def __init__(self, periods=14, interval='1h', window_days=4):
+        self.periods = periods
+        self.interval = interval
+        self.window = timedelta(days=window_days)
+        self.alpha = 2 / (periods + 1)  # ewm(span=periods, adjust=False)
+        self.states = {}
+        self.dirty = set()
+        self.persisted = set()  # symbols whose state has a row in rsi_state, loaded or written by this engine
+
+    def bucket(self, timestamp):
+        return toLocalNaive(timestamp).floor(self.interval)
+
+    def update(self, symbol, timestamp, price):
+        if price is None or pd.isna(price):
+            return self.getRsi(symbol)
+
+        bar_time = self.bucket(timestamp)
+        state = self.states.get(symbol)
+
+        if state is None:
+            state = RsiState(bar_time, price)
+            self.states[symbol] = state
+        elif bar_time > state.bar_time:
+            state.prev_close, state.prev_avg_gain, state.prev_avg_loss = state.close, state.avg_gain, state.avg_loss
+            state.bar_time = bar_time
+            state.bars += 1
+            state.apply(price, self.alpha)
+        elif bar_time == state.bar_time:
+            # Same bar as before: the new price replaces the close, like resample's 'last'
+            state.apply(price, self.alpha)
+        else:
+            logging.debug("Ignoring out of order price for %s at %s, state is at %s", symbol, timestamp, state.bar_time,
+                          extra={'symbol': symbol})
+            return self.getRsi(symbol)
+
+        self.dirty.add(symbol)
+        return self.getRsi(symbol)
+
+    def getRsi(self, symbol):
+        state = self.states.get(symbol)
+        if state is None or state.bars < self.periods:
+            return None
+
+        rsi = state.rsi
+        return None if math.isnan(rsi) else rsi
+
+    def isWarm(self, symbol, now=None):
+        state = self.states.get(symbol)
+        if state is None:
+            return False
+        now = toLocalNaive(now if now is not None else pd.Timestamp.now())
+        return now - state.bar_time <= self.window
+
+    def seedFromBars(self, bars):
+        # bars is resampleData() output; one grouped EWM replaces the per bar updates
+        bars = bars.dropna(subset=['price']).sort_values(['symbol', 'timestamp']).reset_index(drop=True)
+        if bars.empty:
+            return
+
+        prices = bars['price'].astype(float)
+        delta = prices.groupby(bars['symbol']).diff()
+        bars['price'] = prices
+        bars['avg_gain'] = delta.where(delta > 0, 0).groupby(bars['symbol']).ewm(span=self.periods, adjust=False).mean().reset_index(level=0, drop=True)
+        bars['avg_loss'] = (-delta.where(delta < 0, 0)).groupby(bars['symbol']).ewm(span=self.periods, adjust=False).mean().reset_index(level=0, drop=True)
+
+        counts = bars.groupby('symbol').size()
+        previous = bars.groupby('symbol').nth(-2).set_index('symbol')
+
+        for row in bars.groupby('symbol').tail(1).itertuples(index=False):
+            state = RsiState(row.timestamp, row.price, row.avg_gain, row.avg_loss, counts[row.symbol])
+            if row.symbol in previous.index:
+                prev = previous.loc[row.symbol]
+                state.prev_close, state.prev_avg_gain, state.prev_avg_loss = float(prev['price']), float(prev['avg_gain']), float(prev['avg_loss'])
+            self.states[row.symbol] = state
+            self.dirty.add(row.symbol)
+
+    def rebuild(self, symbols):
+        symbols = list(symbols)
+        if not symbols:
+            return
+
+        logging.info("Rebuilding RSI state for %d symbols from market_data", len(symbols))
+        for symbol in symbols:
+            self.states.pop(symbol, None)
+
+        marketData = fetchMarketDataOfLastDays(symbols, days=self.window.days, interval=self.interval)
+        if not marketData.empty:
+            self.seedFromBars(resampleData(marketData, interval=self.interval))
+
+    def load(self, symbols):
+        symbols = list(symbols)
+        if not symbols:
+            return
+
+        query = text("""
+        SELECT symbol, bar_time, bars, close, avg_gain, avg_loss, prev_close, prev_avg_gain, prev_avg_loss
+        FROM rsi_state
+        WHERE bar_interval = :interval AND periods = :periods
+        AND symbol IN :symbols
+        """)
+
+        try:
+            with engine.connect() as connection:
+                result = connection.execute(query, {"interval": self.interval, "periods": self.periods, "symbols": tuple(symbols)})
+                for row in result:
+                    self.states[row.symbol] = RsiState(row.bar_time, row.close, row.avg_gain, row.avg_loss, row.bars,
+                                                       row.prev_close, row.prev_avg_gain, row.prev_avg_loss)
+                    self.persisted.add(row.symbol)
+        except exc.SQLAlchemyError as e:
+            logging.error("Failed to load RSI state, falling back to a rebuild from market_data: %s", e)
+
+    def invalidated(self, connection, symbols, lock=False):
+        # A state this engine loaded or wrote whose row is gone was reset by backfill-market-data.py: older prices
+        # were inserted below it. With lock, the remaining rows stay locked until the caller commits, so a reset
+        # waits for the write instead of being overwritten by it.
+        symbols = sorted(symbol for symbol in symbols if symbol in self.persisted)
+        if not symbols:
+            return set()
+
+        present = connection.execute(text(f"""
+        SELECT symbol FROM rsi_state
+        WHERE bar_interval = :interval AND periods = :periods
+        AND symbol IN :symbols
+        ORDER BY symbol{' FOR UPDATE' if lock else ''}
+        """), {"interval": self.interval, "periods": self.periods, "symbols": tuple(symbols)}).scalars()
+        return set(symbols) - set(present)
+
+    def forget(self, symbols):
+        for symbol in symbols:
+            self.states.pop(symbol, None)
+            self.dirty.discard(symbol)
+            self.persisted.discard(symbol)
+
+    def dropInvalidated(self, symbols):
+        # Called before a batch, so reset symbols are rebuilt from market_data before their next price is applied
+        try:
+            with engine.connect() as connection:
+                reset = self.invalidated(connection, symbols)
+        except exc.SQLAlchemyError as e:
+            logging.warning("Could not check the RSI state for resets: %s", e)
+            return
+        if reset:
+            logging.info("RSI state of %d symbols was reset, rebuilding it from market_data", len(reset))
+            self.forget(reset)
+
+    def writeState(self, connection):
+        # Upserts the changed states on the caller's connection; the caller commits, then calls committed().
+        # States reset since the batch started are not written back; the next batch rebuilds them.
+        reset = self.invalidated(connection, self.dirty, lock=True)
+        if reset:
+            logging.info("RSI state of %d symbols was reset during the batch, not saving it", len(reset))
+            self.forget(reset)
+
+        params = []
+        for symbol in sorted(self.dirty):
+            state = self.states[symbol]
+            params.append({
+                "symbol": symbol, "interval": self.interval, "periods": self.periods,
+                "bar_time": str(state.bar_time), "bars": state.bars, "close": state.close,
+                "avg_gain": state.avg_gain, "avg_loss": state.avg_loss, "prev_close": state.prev_close,
+                "prev_avg_gain": state.prev_avg_gain, "prev_avg_loss": state.prev_avg_loss
+            })
+        if not params:
+            return 0
+
+        executeValues(connection, """
+        INSERT INTO rsi_state (symbol, bar_interval, periods, bar_time, bars, close, avg_gain, avg_loss, prev_close, prev_avg_gain, prev_avg_loss)
+        VALUES {values}
+        ON CONFLICT (symbol, bar_interval, periods) DO UPDATE SET
+            bar_time = EXCLUDED.bar_time, bars = EXCLUDED.bars, close = EXCLUDED.close,
+            avg_gain = EXCLUDED.avg_gain, avg_loss = EXCLUDED.avg_loss, prev_close = EXCLUDED.prev_close,
+            prev_avg_gain = EXCLUDED.prev_avg_gain, prev_avg_loss = EXCLUDED.prev_avg_loss, updated_at = CURRENT_TIMESTAMP
+        """, ("symbol", "interval", "periods", "bar_time", "bars", "close", "avg_gain", "avg_loss", "prev_close",
+              "prev_avg_gain", "prev_avg_loss"), params)
+        logging.debug("Saved RSI state for %d symbols", len(params))
+        return len(params)
+
+    def committed(self):
+        self.persisted |= self.dirty
+        self.dirty.clear()
+
+    def discard(self):
+        # The transaction with the prices behind these states was rolled back: forget them, so the next run loads
+        # the last committed state from rsi_state instead of continuing from prices market_data never got
+        self.forget(list(self.dirty))
+
+    def save(self):
+        try:
+            with engine.begin() as connection:
+                self.writeState(connection)
+            self.committed()
+        except exc.SQLAlchemyError as e:
+            logging.error("Failed to save RSI state for %d symbols: %s", len(self.dirty), e)
+            print(f"Failed to save RSI state for {len(self.dirty)} symbols: {e}")
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event, exc, text
+
+# RUN_METRICS=0 turns instrumentation off; spans then cost one attribute check and nothing is recorded
+RUN_METRICS_ENABLED = os.getenv('RUN_METRICS', '1') not in ('0', 'false', 'no')
+
+UUID_SEGMENT = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+PRODUCT_SEGMENT = re.compile(r'^[A-Z0-9]+-[A-Z0-9]+$')
+SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+
+class Span:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class RunMetrics:
+    # Wall time per span name (count, total and slowest) and plain counters, accumulated over one run.
+    # Spans in worker threads add up, so a span's total can exceed the run's duration.
+    def __init__(self, enabled=RUN_METRICS_ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.perf_counter()
+            self.spans = {}
+            self.counters = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = {'count': 1, 'seconds': seconds, 'max': seconds}
+            else:
+                span['count'] += 1
+                span['seconds'] += seconds
+                span['max'] = max(span['max'], seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        with self.lock:
+            return {
+                'duration': time.perf_counter() - self.started,
+                'spans': {name: dict(span) for name, span in sorted(self.spans.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+
+runMetrics = RunMetrics()
+
+def timed(name):
+    # Decorator form of runMetrics.span(); with metrics disabled the function is returned unwrapped
+    def decorate(function):
+        if not runMetrics.enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            with runMetrics.span(name):
+                return function(*args, **kwargs)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorate
+
+def endpointName(method, uri):
+    # "GET /api/v3/brokerage/orders/historical/{id}": ids and product ids are folded so endpoints group together
+    segments = ['{id}' if UUID_SEGMENT.match(s) or PRODUCT_SEGMENT.match(s) else s for s in uri.split('?')[0].split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+def instrumentEngine(engine):
+    # One span per statement, named by verb and first table, e.g. "sql INSERT market_data"
+    if not runMetrics.enabled:
+        return
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('metrics_started', None)
+        if started is None:
+            return
+
+        words = statement.split(None, 1)
+        table = SQL_TABLE.search(statement)
+        name = f"sql {words[0].upper() if words else '?'}{' ' + table.group(1) if table else ''}"
+        runMetrics.record(name, time.perf_counter() - started)
+        if cursor.rowcount and cursor.rowcount > 0:
+            runMetrics.count('sql_rows', cursor.rowcount)
+
+def storeRunMetrics(engine, run):
+    # One row per run in run_metrics, which Logstash ships to Elasticsearch
+    if not runMetrics.enabled:
+        return None
+
+    summary = runMetrics.summary()
+    logging.info("Run metrics for %s: %s", run, json.dumps(summary))
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("""
+            INSERT INTO run_metrics (run, duration, metrics)
+            VALUES (:run, :duration, CAST(:metrics AS jsonb))
+            """), {"run": run, "duration": summary['duration'], "metrics": json.dumps(summary)})
+    except exc.SQLAlchemyError as e:
+        logging.warning("Failed to store run metrics: %s", e)
+    return summary
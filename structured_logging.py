@@ -0,0 +1,62 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+from datetime import datetime, timezone
+
+BEARER_TOKEN = re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]+')
+
+# Attributes every LogRecord has; anything else on a record came in through `extra=` and becomes a JSON field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+def redact(text):
+    return BEARER_TOKEN.sub(r'\1[REDACTED]', text)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # One JSON object per line; fields passed with extra={'symbol': ..., 'order_id': ..., 'latency': ...}
+    # are top level keys, so Logstash can index them without a grok pattern
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = redact(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stdlib QueueHandler runs the formatter in the calling thread. Here the caller only merges the %-style
+    # arguments into the message; timestamps, JSON and tracebacks are formatted by the listener thread.
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def setupQueueLogging(handler, log_level=logging.INFO):
+    # The root logger only enqueues records; a background thread writes them through `handler`
+    logQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(logQueue, handler, respect_handler_level=True)
+    logging.basicConfig(level=log_level, handlers=[DeferredQueueHandler(logQueue)])
+    listener.start()
+    atexit.register(listener.stop)  # Drain the queue before the interpreter exits
+    return listener
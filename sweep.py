@@ -0,0 +1,107 @@
+from common_functions import *
+from backtest import loadPriceHistory, resampleToPriceMatrix, calculateRsiMatrix, runBacktest, summarizeBacktest
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import random
+import tempfile
+
+# Per worker state: the raw ticks are loaded once, price and RSI matrices are built once per interval/period
+workerTicks = None
+workerPrices = {}
+workerRsi = {}
+
+def parseSweepArguments():
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over a historical replay of market_data",
+                                     parents=[commonParser])
+    parser.add_argument('--days', type=int, default=365, help='Number of days of history to replay')
+    parser.add_argument('--rsi-periods', default=str(RSI_PERIODS), help='Comma separated RSI spans')
+    parser.add_argument('--interval', default=RSI_INTERVAL, help='Comma separated bar intervals')
+    parser.add_argument('--buy-below', default=str(BUY_RSI_THRESHOLD), help='Comma separated buy thresholds')
+    parser.add_argument('--sell-above', default=str(SELL_RSI_THRESHOLD), help='Comma separated sell thresholds')
+    parser.add_argument('--top-n', default=str(MAX_BUY_OPPORTUNITIES), help='Comma separated numbers of picks per run')
+    parser.add_argument('--min-order', default=str(MIN_ORDER_EUR), help='Comma separated minimum order sizes in EUR')
+    parser.add_argument('--random', type=int, default=0, help='Evaluate this many random configurations instead of the full grid')
+    parser.add_argument('--rebalance', default='4h', help='How often the simulated bot runs')
+    parser.add_argument('--start-eur', type=float, default=1000.0, help='Starting EUR balance')
+    parser.add_argument('--fee', type=float, default=0.006, help='Fee rate charged on every order')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--top', type=int, default=20, help='Number of results to print')
+    parser.add_argument('--output', help='Write all results to this CSV file')
+    parser.add_argument('--cache', action='store_true', help='Read raw ticks from the local history cache')
+    return parser.parse_args()
+
+def parseValues(values, cast):
+    return [cast(value.strip()) for value in values.split(',') if value.strip()]
+
+def buildConfigurations(sweepArgs):
+    grid = {
+        'rsi_periods': parseValues(sweepArgs.rsi_periods, int),
+        'interval': parseValues(sweepArgs.interval, str),
+        'buy_below': parseValues(sweepArgs.buy_below, float),
+        'sell_above': parseValues(sweepArgs.sell_above, float),
+        'top_n': parseValues(sweepArgs.top_n, int),
+        'min_order': parseValues(sweepArgs.min_order, int),
+    }
+    configurations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    configurations = [c for c in configurations if c['buy_below'] < c['sell_above']]
+
+    if sweepArgs.random and sweepArgs.random < len(configurations):
+        configurations = random.sample(configurations, sweepArgs.random)
+
+    # Neighbouring configurations share price and RSI matrices inside a worker
+    return sorted(configurations, key=lambda c: (c['interval'], c['rsi_periods']))
+
+def initWorker(ticksPath):
+    global workerTicks
+    workerTicks = pd.read_pickle(ticksPath)
+
+def getMatrices(interval, periods):
+    if interval not in workerPrices:
+        workerPrices[interval] = resampleToPriceMatrix(workerTicks, interval=interval)
+    if (interval, periods) not in workerRsi:
+        workerRsi[(interval, periods)] = calculateRsiMatrix(workerPrices[interval], periods=periods)
+    return workerPrices[interval], workerRsi[(interval, periods)]
+
+def evaluateConfiguration(configuration, rebalance, start_eur, fee):
+    prices, rsi = getMatrices(configuration['interval'], configuration['rsi_periods'])
+    trades, equity = runBacktest(prices, rsi, configuration, rebalance=rebalance, start_eur=start_eur, fee=fee)
+    return {**configuration, **summarizeBacktest(trades, equity, start_eur=start_eur)}
+
+def runSweep(ticks, configurations, rebalance='4h', start_eur=1000.0, fee=0.006, workers=None):
+    with tempfile.TemporaryDirectory() as directory:
+        ticksPath = os.path.join(directory, 'ticks.pkl')
+        ticks.to_pickle(ticksPath)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(ticksPath,)) as pool:
+            chunksize = max(1, len(configurations) // (4 * (workers or os.cpu_count() or 1)))
+            results = list(pool.map(evaluateConfiguration, configurations,
+                                    itertools.repeat(rebalance), itertools.repeat(start_eur), itertools.repeat(fee),
+                                    chunksize=chunksize))
+
+    return pd.DataFrame(results).sort_values(['return', 'max_drawdown'], ascending=[False, False]).reset_index(drop=True)
+
+if __name__ == '__main__':
+    sweepArgs = parseSweepArguments()
+    configurations = buildConfigurations(sweepArgs)
+
+    started = time.perf_counter()
+    ticks = loadPriceHistory(sweepArgs.days, intervals={c['interval'] for c in configurations},
+                             cache=sweepArgs.cache)
+    if ticks.empty:
+        print(f"No market data in the last {sweepArgs.days} days.")
+        raise SystemExit(1)
+
+    print(f"Evaluating {len(configurations)} configurations on {len(ticks)} ticks with {sweepArgs.workers} workers")
+    results = runSweep(ticks, configurations, rebalance=sweepArgs.rebalance, start_eur=sweepArgs.start_eur,
+                       fee=sweepArgs.fee, workers=sweepArgs.workers)
+
+    print(f"Finished in {time.perf_counter() - started:.2f}s")
+    print(results.head(sweepArgs.top).to_string(formatters={
+        'return': '{:.2%}'.format,
+        'max_drawdown': '{:.2%}'.format,
+        'final_equity': '{:.2f}'.format,
+    }))
+
+    if sweepArgs.output:
+        results.to_csv(sweepArgs.output, index=False)
+        print(f"Results written to {sweepArgs.output}")
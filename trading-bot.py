@@ -5,143 +5,90 @@ from psycopg2.extras import DictCursor
 from decimal import Decimal, ROUND_DOWN
 import uuid
 import math
+from concurrent.futures import ThreadPoolExecutor
+from market_window import marketWindow
+from indicators import INDICATOR_INTERVALS, loadIndicators, filterSymbols
+
+# The trading cycle's own options; trading-daemon.py imports this module and includes them in its parser
+botParser = argparse.ArgumentParser(add_help=False)
+botParser.add_argument('--buy-filter',
+                       help='Only buy symbols matching this indicator expression, e.g. "rsi_1h < 30 and price > sma_4h"')
+
+def parseBotArguments():
+    parser = argparse.ArgumentParser(description="Trade EUR pairs on RSI signals", parents=[commonParser, botParser])
+    return parser.parse_args()
+
+# Read on import, because the cycle also runs inside the daemon; the entry points validate the command line
+botArgs = botParser.parse_known_args()[0]
 
 try:
     with engine.connect() as connection:
         result = connection.execute(text("SELECT 1"))
         logging.info("Database connection successful")
 except Exception as e:
-    logging.error(f"Error connecting to database: {e}")
+    logging.error("Error connecting to database: %s", e)
     raise
 
 def getTradableCurrencies() -> List[str]:
     eurQuotes = getAllEURQuotes()
     return [product['base_currency_id'] for product in eurQuotes]
 
-def getTradableCurrencies() -> List[str]:
-    eurQuotes = getAllEURQuotes()
-    return [product['base_currency_id'] for product in eurQuotes]
-
-def getSellOpportunities():
+def getSellOpportunities(snapshot):
     global tradableCurrencies
-    global marketData
-    global resampledData
     global allCurrencyAnalysis
 
-    accountsJson = getAccounts()
-    sellableBalances = getSellableBalances(accountsJson)
+    sellableBalances = getSellableBalances(snapshot)
     sellableBalances = {k: v for k, v in sellableBalances.items() if k not in known_stablecoins}
-    logging.info(f"Sellable non-stablecoin balances: {sellableBalances}")
+    logging.info("Sellable non-stablecoin balances: %s", sellableBalances)
     
     # Log analysis for all non-stablecoin currencies
     logging.info("Analysis for all non-stablecoin currencies:")
     for currency, analysis in allCurrencyAnalysis.items():
-        logging.info(f"{currency}: Current price {analysis['currentPrice']:.4f}, "
-                     f"RSI {analysis['rsi']:.2f}")
+        logging.info("%s: Current price %.4f, RSI %.2f", currency, analysis['currentPrice'], analysis['rsi'],
+                     extra={'symbol': currency})
     
     # Filter for sell opportunities
-    sellOpportunities = []
-    for currency, analysis in allCurrencyAnalysis.items():
-        if currency in sellableBalances:
-            balance = sellableBalances[currency]
-            if balance > Decimal('0.00001') and analysis['rsi'] > 70:  # Entfernen Sie die MA-Bedingung
-                opportunity = {
-                    'symbol': currency,
-                    'currentPrice': analysis['currentPrice'],
-                    'rsi': analysis['rsi'],
-                    'availableBalance': float(balance)
-                }
-                sellOpportunities.append(opportunity)
+    sellOpportunities = selectSellOpportunities(allCurrencyAnalysis, sellableBalances)
 
     if sellOpportunities:
         logging.info("Sell opportunities (with available balance):")
         for opportunity in sellOpportunities:
-            logging.info(f"{opportunity['symbol']} with current price {opportunity['currentPrice']:.4f}, "
-                         f"RSI {opportunity['rsi']:.2f}, "
-                         f"Available balance: {opportunity['availableBalance']:.8f}")
+            logging.info("%s with current price %.4f, RSI %.2f, Available balance: %.8f", opportunity['symbol'],
+                         opportunity['currentPrice'], opportunity['rsi'], opportunity['availableBalance'],
+                         extra={'symbol': opportunity['symbol']})
     else:
         logging.info("No sell opportunities found based on the criteria and available balances.")
         print("No sell opportunities found based on the criteria and available balances.")
     
     return sellOpportunities
 
-def getBuyOpportunities():
+def getBuyOpportunities(snapshot, allowed=None):
     global tradableCurrencies
-    global marketData
-    global resampledData
     global allCurrencyAnalysis
 
-    eur_balance = Decimal(getAccountEURBalance())
-    eur_balance = Decimal(str(math.floor(eur_balance / 10) * 10))
-    print(f"Available EUR balance (rounded down to nearest ten): {eur_balance}")
+    candidates = allCurrencyAnalysis
+    if allowed is not None:
+        candidates = {currency: analysis for currency, analysis in allCurrencyAnalysis.items() if currency in allowed}
+        logging.info("Buy filter leaves %d of %d currencies: %s", len(candidates), len(allCurrencyAnalysis), sorted(candidates))
 
-    if eur_balance < 10:
-        print("Insufficient EUR available for investment.")
+    eur_balance = Decimal(getAccountEURBalance(snapshot))
+    buy_opportunities = selectBuyOpportunities(candidates, eur_balance, verbose=True)
+    if not buy_opportunities:
         return []
 
-    # Filter currencies with RSI < 30 and sort them by RSI in ascending order
-    top_performers = sorted(
-        [(currency, analysis) for currency, analysis in allCurrencyAnalysis.items() if analysis['rsi'] < 50],
-        key=lambda x: x[1]['rsi']
-    )[:3]  # Limit to top 3
-
-    if not top_performers:
-        print("No cryptocurrencies with RSI < 50 found. Investment postponed.")
-        return []
-
-    buy_opportunities = []
-    
-    # Spezialfall: Wenn genau 10 Euro verfügbar sind
-    if eur_balance == Decimal('10'):
-        top_currency, top_analysis = top_performers[0]
-        buy_opportunities.append({
-            'symbol': top_currency,
-            'amount_eur': eur_balance,
-            'current_price': top_analysis['currentPrice'],
-            'rsi': top_analysis['rsi']
-        })
-        print(f"Exactly €10 available. Investing all in top opportunity: {top_currency}")
-    else:
-        remaining_balance = eur_balance
-        total_inverse_rsi = sum(1 / analysis['rsi'] for _, analysis in top_performers)
-        
-        for currency, analysis in top_performers:
-            if remaining_balance < 10:
-                print(f"Remaining balance {remaining_balance} is less than 10 EUR. Stopping.")
-                break
-            
-            # Calculate weight based on inverse of RSI
-            weight = (1 / analysis['rsi']) / total_inverse_rsi
-            investment_amount = eur_balance * Decimal(weight)
-            rounded_amount = Decimal(math.floor(investment_amount / 10) * 10)
-            
-            print(f"Considering {currency}: Investment amount before rounding: {investment_amount}, after rounding: {rounded_amount}")
-            
-            if rounded_amount >= 10:
-                buy_opportunities.append({
-                    'symbol': currency,
-                    'amount_eur': rounded_amount,
-                    'current_price': analysis['currentPrice'],
-                    'rsi': analysis['rsi']
-                })
-                remaining_balance -= rounded_amount
-                print(f"Added buy opportunity for {currency}: {rounded_amount} EUR. Remaining balance: {remaining_balance}")
-            else:
-                print(f"Skipping {currency} because rounded amount {rounded_amount} is less than 10 EUR")
-
     print("Final buy opportunities:")
     for opportunity in buy_opportunities:
         print(f"{opportunity['symbol']}: €{opportunity['amount_eur']} (RSI: {opportunity['rsi']:.2f})")
 
     return buy_opportunities
 
-def getAccountEURBalance():
-    accountsJson = getAccounts()
-    accounts = json.loads(accountsJson)['accounts']
+def getAccountEURBalance(snapshot=None):
+    if snapshot is None:
+        snapshot = AccountSnapshot()
+    account = snapshot.getAccount('EUR')
     
-    for account in accounts:
-        if account['currency'] == 'EUR':
-            return account['available_balance']['value']
+    if account:
+        return account['available_balance']['value']
     
     return '0'  
 
@@ -161,45 +108,94 @@ def saveTradeToDb(symbol, trade_type, amount, price, total_value, transaction_id
                 "total_value": total_value,
                 "transaction_id": transaction_id
             })
-            logging.info(f"Trade saved to database: {trade_type} {amount} {symbol}")
-            logging.debug(f"Database insert result: {result.rowcount} row(s) affected")
+            logging.info("Trade saved to database: %s %s %s", trade_type, amount, symbol,
+                         extra={'symbol': symbol, 'order_id': transaction_id})
+            logging.debug("Database insert result: %d row(s) affected", result.rowcount, extra={'order_id': transaction_id})
     except Exception as e:
-        logging.error(f"Error saving trade to database: {e}")
+        logging.error("Error saving trade to database: %s", e, extra={'symbol': symbol, 'order_id': transaction_id})
         raise  
 
-def getSellableBalances(accountsJson):
-    accounts = json.loads(accountsJson)['accounts']
+def savePendingOrder(symbol, trade_type, order_id):
+    # An order that did not settle before the fill deadline; reconcilePendingOrders() saves its trade later
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("""
+            INSERT INTO pending_orders (order_id, symbol, type) VALUES (:order_id, :symbol, :type)
+            ON CONFLICT (order_id) DO NOTHING
+            """), {"order_id": order_id, "symbol": symbol, "type": trade_type})
+    except Exception as e:
+        logging.error("Error saving pending order %s: %s", order_id, e, extra={'symbol': symbol, 'order_id': order_id})
+
+def reconcilePendingOrders():
+    # Orders still open at the end of an earlier cycle: their trade is saved once they reach a terminal status.
+    # The trades lookup keeps a crash between saving the trade and deleting the pending row from saving it twice.
+    try:
+        with engine.connect() as connection:
+            pending = connection.execute(text("SELECT order_id, symbol, type FROM pending_orders ORDER BY placed_at")).fetchall()
+    except exc.SQLAlchemyError as e:
+        logging.warning("Could not read pending orders: %s", e)
+        return
+
+    for order_id, symbol, trade_type in pending:
+        try:
+            order_details = getOrderDetails(order_id)
+            status = order_details.get("status") if order_details else None
+            if status not in TERMINAL_ORDER_STATUSES:
+                logging.info("Order %s for %s is still %s", order_id, symbol, status,
+                             extra={'symbol': symbol, 'order_id': order_id, 'status': status})
+                continue
+
+            filled_size = float(order_details.get("filled_size") or 0)
+            filled_value = float(order_details.get("filled_value") or 0)
+            with engine.connect() as connection:
+                saved = connection.execute(text("SELECT 1 FROM trades WHERE transaction_id = :order_id"),
+                                           {"order_id": order_id}).first() is not None
+            if filled_size > 0 and filled_value > 0 and not saved:
+                saveTradeToDb(symbol, trade_type, filled_size, filled_value / filled_size, filled_value, order_id)
+            else:
+                logging.info("Order %s for %s ended as %s without a fill to save", order_id, symbol, status,
+                             extra={'symbol': symbol, 'order_id': order_id, 'status': status})
+
+            with engine.begin() as connection:
+                connection.execute(text("DELETE FROM pending_orders WHERE order_id = :order_id"), {"order_id": order_id})
+        except Exception as e:
+            logging.error("Failed to reconcile order %s: %s", order_id, e, extra={'symbol': symbol, 'order_id': order_id})
+
+def getSellableBalances(snapshot):
     sellableBalances = {}
     
-    for account in accounts:
+    for account in snapshot.accounts:
         currency = account['currency']
         balance = Decimal(account['available_balance']['value'])
         
-        eurValue = getWalletsEurValue(currency)
-        logging.debug(f"{currency} wallet has the € value " + str(eurValue))
+        eurValue = snapshot.getWalletsEurValue(currency)
+        logging.debug("%s wallet has the € value %s", currency, eurValue, extra={'symbol': currency})
 
-        if eurValue > 0.90:
+        if eurValue is not None and eurValue > 0.90:
             sellableBalances[currency] = balance
     
     return sellableBalances
 
+@timed('order_sell')
 def sellCurrency(opportunity, force=False, decimal_places=8):
     if TESTING_MODE and not force:
-        logging.info(f"TESTING: Would sell {opportunity['availableBalance']} of {opportunity['symbol']} with {decimal_places} decimal places")
+        # The size a real sell would order: quantized to the product's base_increment, or the full balance when
+        # the product has no metadata and the sell would probe decimal places
+        size = productCatalog.quantizeBaseSize(f"{opportunity['symbol']}-EUR", Decimal(str(opportunity['availableBalance'])))
+        logging.info("TESTING: Would sell %s of %s", opportunity['availableBalance'] if size is None else size,
+                     opportunity['symbol'], extra={'symbol': opportunity['symbol']})
         return None
 
     symbol = opportunity['symbol']
     base_amount = Decimal(str(opportunity['availableBalance']))
     
     if base_amount <= Decimal('0.00001'):  # Minimum amount to sell
-        logging.warning(f"Amount too small to sell for {symbol}: {base_amount}")
+        logging.warning("Amount too small to sell for %s: %s", symbol, base_amount, extra={'symbol': symbol})
         return None
 
     product_id = f"{symbol}-EUR"
 
-    def trySell(amount, places):
-        rounded_amount = amount.quantize(Decimal('1e-{}'.format(places)), rounding=ROUND_DOWN)
-        
+    def trySell(rounded_amount):
         order_data = {
             "client_order_id": str(uuid.uuid4()),
             "product_id": product_id,
@@ -212,29 +208,36 @@ def sellCurrency(opportunity, force=False, decimal_places=8):
         }
         
         payload = json.dumps(order_data)
-        logging.debug(f"Sending sell order with payload: {payload}")
+        logging.debug("Sending sell order with payload: %s", payload, extra={'symbol': symbol})
         response = getResponseFromAPI("/api/v3/brokerage/orders", method='POST', data=payload)
         
-        logging.debug(f"Full API response: {response}")
+        logging.debug("Full API response: %s", response, extra={'symbol': symbol})
         
         response_json = json.loads(response)
         if "success" in response_json and response_json["success"]:
             order_id = response_json["success_response"]["order_id"]
             
-            time.sleep(2)
-            order_details = getOrderDetails(order_id)
+            order_details = waitForOrderFill(order_id)
             
             if order_details:
-                filled_size = float(order_details.get("filled_size", rounded_amount))
-                filled_value = float(order_details.get("filled_value", 0))
-                price = filled_value / filled_size if filled_size > 0 else opportunity['currentPrice']
-                
-                logging.info(f"Sold {filled_size} {symbol} for approximately {filled_value:.2f} EUR at price {price:.2f}")
-                print(f"Sold {filled_size} {symbol} for approximately {filled_value:.2f} EUR at price {price:.2f}")
-                
-                saveTradeToDb(symbol, "SELL", filled_size, price, filled_value, order_id)
+                filled_size = float(order_details.get("filled_size") or 0)
+                filled_value = float(order_details.get("filled_value") or 0)
+
+                if filled_size > 0:
+                    price = filled_value / filled_size
+                    
+                    logging.info("Sold %s %s for approximately %.2f EUR at price %.2f", filled_size, symbol, filled_value, price,
+                                 extra={'symbol': symbol, 'order_id': order_id})
+                    print(f"Sold {filled_size} {symbol} for approximately {filled_value:.2f} EUR at price {price:.2f}")
+                    
+                    saveTradeToDb(symbol, "SELL", filled_size, price, filled_value, order_id)
+                else:
+                    logging.warning("Sell order for %s ended as %s without a fill. Order ID: %s", symbol, order_details.get('status'),
+                                    order_id, extra={'symbol': symbol, 'order_id': order_id, 'status': order_details.get('status')})
             else:
-                logging.warning(f"Order placed but unable to retrieve details. Order ID: {order_id}")
+                logging.warning("Order placed but no final fill within %ss, saving it as pending. Order ID: %s",
+                                ORDER_FILL_DEADLINE, order_id, extra={'symbol': symbol, 'order_id': order_id})
+                savePendingOrder(symbol, "SELL", order_id)
             
             return True
         else:
@@ -242,21 +245,37 @@ def sellCurrency(opportunity, force=False, decimal_places=8):
             if "Too many decimals in order amount" in error_message:
                 return False
             else:
-                logging.error(f"Error selling {rounded_amount} {symbol}: {error_message}")
+                logging.error("Error selling %s %s: %s", rounded_amount, symbol, error_message, extra={'symbol': symbol})
                 print(f"Error selling {rounded_amount} {symbol}: {error_message}")
-                logging.error(f"Full error response: {json.dumps(response_json, indent=2)}")
+                logging.error("Full error response: %s", response, extra={'symbol': symbol})
                 return None
 
+    # The product's base_increment gives the valid size up front, so a sell is a single order
+    rounded_amount = productCatalog.quantizeBaseSize(product_id, base_amount)
+    if rounded_amount is not None:
+        if rounded_amount <= 0:
+            logging.warning("Amount too small to sell for %s: %s is below the minimum order size", symbol, base_amount,
+                            extra={'symbol': symbol})
+            return None
+        result = trySell(rounded_amount)
+        if result is False:
+            logging.error("Exchange rejected %s %s despite base_increment %s", rounded_amount, symbol,
+                          productCatalog.get(product_id)['base_increment'], extra={'symbol': symbol})
+        return "Success" if result is True else None
+
+    # No metadata for this product: fall back to probing decimal places
+    logging.warning("No product metadata for %s, probing decimal places", product_id, extra={'symbol': symbol})
     for places in range(decimal_places, 0, -1):
-        result = trySell(base_amount, places)
+        result = trySell(base_amount.quantize(Decimal('1e-{}'.format(places)), rounding=ROUND_DOWN))
         if result is True:
             return "Success"
         elif result is None:
             return None  
 
-    logging.error(f"Failed to sell {symbol} even with 1 decimal place")
+    logging.error("Failed to sell %s even with 1 decimal place", symbol, extra={'symbol': symbol})
     return None
 
+@timed('order_buy')
 def buyCurrency(symbol, amount_eur, force=False):
     print(f"Attempting to buy {symbol} for {amount_eur} EUR")
     
@@ -269,6 +288,11 @@ def buyCurrency(symbol, amount_eur, force=False):
         return None
 
     product_id = f"{symbol}-EUR"
+
+    quote_size = productCatalog.quantizeQuoteSize(product_id, amount_eur)
+    if quote_size is not None and quote_size <= 0:
+        print(f"Skipping buy for {symbol} because {amount_eur} EUR is below the product's minimum order size")
+        return None
     
     order_data = {
         "client_order_id": str(uuid.uuid4()),
@@ -276,62 +300,78 @@ def buyCurrency(symbol, amount_eur, force=False):
         "side": "BUY",
         "order_configuration": {
             "market_market_ioc": {
-                "quote_size": str(amount_eur)
+                "quote_size": str(quote_size if quote_size is not None else amount_eur)
             }
         }
     }
     
     payload = json.dumps(order_data)
-    logging.debug(f"Sending buy order with payload: {payload}")
+    logging.debug("Sending buy order with payload: %s", payload, extra={'symbol': symbol})
     response = getResponseFromAPI("/api/v3/brokerage/orders", method='POST', data=payload)
     
-    logging.debug(f"Full API response: {response}")
+    logging.debug("Full API response: %s", response, extra={'symbol': symbol})
     
     try:
         response_json = json.loads(response)
         if "success" in response_json and response_json["success"]:
             order_id = response_json["success_response"]["order_id"]
             
-            time.sleep(2)
-            order_details = getOrderDetails(order_id)
+            order_details = waitForOrderFill(order_id)
             
             if order_details:
-                filled_size = float(order_details.get("filled_size", 0))
-                filled_value = float(order_details.get("filled_value", amount_eur))
+                filled_size = float(order_details.get("filled_size") or 0)
+                filled_value = float(order_details.get("filled_value") or 0)
                 
                 if filled_size > 0 and filled_value > 0:
                     price = filled_value / filled_size
                     
-                    logging.info(f"Successfully bought approximately {filled_size:.8f} {symbol} for {filled_value:.2f}€ at price {price:.2f}")
+                    logging.info("Successfully bought approximately %.8f %s for %.2f€ at price %.2f", filled_size, symbol, filled_value,
+                                 price, extra={'symbol': symbol, 'order_id': order_id})
                     print(f"Successfully bought approximately {filled_size:.8f} {symbol} for {filled_value:.2f}€ at price {price:.2f}")
                     
                     saveTradeToDb(symbol, "BUY", filled_size, price, filled_value, order_id)
                 else:
-                    logging.warning(f"Order placed for {symbol} but filled size or value is zero. Order ID: {order_id}")
+                    logging.warning("Order placed for %s but filled size or value is zero. Order ID: %s", symbol, order_id,
+                                    extra={'symbol': symbol, 'order_id': order_id})
                     print(f"Order placed for {symbol} but no coins were bought. Please check your account.")
             else:
-                logging.warning(f"Order placed but unable to retrieve details. Order ID: {order_id}")
-                print(f"Order placed for {symbol} but unable to retrieve details. Please check your account.")
+                logging.warning("Order placed but no final fill within %ss, saving it as pending. Order ID: %s",
+                                ORDER_FILL_DEADLINE, order_id, extra={'symbol': symbol, 'order_id': order_id})
+                print(f"Order placed for {symbol} but it did not settle in time, its trade is saved in a later cycle.")
+                savePendingOrder(symbol, "BUY", order_id)
             
             return response
         else:
             error_message = response_json.get("error_response", {}).get("message", "Unknown error")
-            logging.error(f"Error buying {amount_eur}€ of {symbol}: {error_message}")
+            logging.error("Error buying %s€ of %s: %s", amount_eur, symbol, error_message, extra={'symbol': symbol})
             print(f"Error buying {amount_eur}€ of {symbol}: {error_message}")
-            logging.error(f"Full error response: {json.dumps(response_json, indent=2)}")
+            logging.error("Full error response: %s", response, extra={'symbol': symbol})
             return None
     except Exception as e:
-        logging.error(f"Exception occurred while processing buy order for {symbol}: {str(e)}")
+        logging.error("Exception occurred while processing buy order for %s: %s", symbol, e, extra={'symbol': symbol})
         print(f"Exception occurred while processing buy order for {symbol}: {str(e)}")
-        logging.error(f"Full response that caused the error: {response}")
+        logging.error("Full response that caused the error: %s", response, extra={'symbol': symbol})
         return None
 
-def printTopRsiValues():
+def executeOrders(orderFunction, orders, max_workers=ORDER_CONCURRENCY):
+    # Orders are independent of each other; each worker also waits for its own fill confirmation
+    if not orders:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(orderFunction, *arguments) for arguments in orders]
 
-    marketData = fetchMarketDataOfLastDays(tradableCurrencies)
-    resampledData = resampleData(marketData, interval='1h')
+    results = []
+    for arguments, future in zip(orders, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logging.error("Order %s%s failed: %s", orderFunction.__name__, arguments, e)
+            print(f"Order {orderFunction.__name__}{arguments} failed: {e}")
+            results.append(None)
+    return results
 
-    all_currency_analysis = determineAllCurrencyAnalysis(resampledData)
+def printTopRsiValues(all_currency_analysis):
     sell_candidates = sorted(all_currency_analysis.items(), key=lambda x: x[1]['rsi'], reverse=True)[:3]
     buy_candidates = sorted(all_currency_analysis.items(), key=lambda x: x[1]['rsi'])[:3]
     
@@ -345,23 +385,54 @@ def printTopRsiValues():
     
     print("\n")
 
-if __name__ == "__main__":
+def runTradingCycle():
+    global tradableCurrencies
+    global allCurrencyAnalysis
+
+    reconcilePendingOrders()
+
     tradableCurrencies = getTradableCurrencies()
     tradableCurrencies = filterOutStablecoins(tradableCurrencies)
-    logging.info(f"Tradable non-stablecoin currencies: {tradableCurrencies}")
+    logging.info("Tradable non-stablecoin currencies: %s", tradableCurrencies)
 
-    marketData = fetchMarketDataOfLastDays(tradableCurrencies)
-    resampledData = resampleData(marketData, interval='1h')
+    # The loader keeps market_analysis current; only symbols without a fresh row there are computed from the bars.
+    # Those are read from market_data once per process, later cycles use the bars the loader appended.
+    allCurrencyAnalysis = fetchMarketAnalysis(tradableCurrencies)
+    stale = [currency for currency in tradableCurrencies if currency not in allCurrencyAnalysis]
+    if stale:
+        logging.info("No fresh market analysis for %d currencies, computing it from market data", len(stale))
+        marketWindow.ensureBackfilled(stale)
+        allCurrencyAnalysis.update(marketWindow.analyse(stale))
 
-    allCurrencyAnalysis = determineAllCurrencyAnalysis(resampledData)
+    printTopRsiValues(allCurrencyAnalysis)
 
-    printTopRsiValues()
+    accountSnapshot = AccountSnapshot()
 
-    sellOpportunities = getSellOpportunities()
-    for opportunity in sellOpportunities:
-        sellCurrency(opportunity)
-    
-    buyOpportunities = getBuyOpportunities()
-    for opportunity in buyOpportunities:
-        buyCurrency(opportunity['symbol'], opportunity['amount_eur'])
+    # All sells complete before the buy phase starts
+    sellOpportunities = getSellOpportunities(accountSnapshot)
+    executeOrders(sellCurrency, [(opportunity,) for opportunity in sellOpportunities])
+
+    if sellOpportunities:
+        accountSnapshot.refresh()  # Sells change the EUR balance available for buying
     
+    allowed = None
+    if botArgs.buy_filter:
+        # All intervals come from one read of the finest bars, so further filter terms cost nothing extra
+        try:
+            indicators = loadIndicators(tradableCurrencies, intervals=INDICATOR_INTERVALS)
+            allowed = set(filterSymbols(indicators, botArgs.buy_filter))
+        except Exception as e:
+            # A broken filter expression or missing data only costs this run its buys
+            logging.warning("Buy filter %r failed, skipping the buys: %s", botArgs.buy_filter, e)
+            allowed = set()
+
+    buyOpportunities = getBuyOpportunities(accountSnapshot, allowed)
+    executeOrders(buyCurrency, [(opportunity['symbol'], opportunity['amount_eur']) for opportunity in buyOpportunities])
+
+    logging.info("JWT cache: %s", getJwtCacheStats())
+    logging.info("Order time-to-fill in seconds: %s", getOrderFillLatencies())
+
+if __name__ == "__main__":
+    botArgs = parseBotArguments()
+    runTradingCycle()
+    storeRunMetrics(engine, 'trading')
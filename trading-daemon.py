@@ -0,0 +1,67 @@
+from common_functions import *
+import importlib
+import signal
+
+# Both scripts are imported once; their engine, HTTP pool and in-memory state stay warm between cycles
+dataLoader = importlib.import_module('coinbase-load-data')
+tradingBot = importlib.import_module('trading-bot')
+
+stopEvent = threading.Event()
+
+def parseDaemonArguments():
+    parser = argparse.ArgumentParser(description="Run data collection and trading cycles on a schedule",
+                                     parents=[commonParser, tradingBot.botParser])
+    parser.add_argument('--data-interval', default='15min', help='Time between data collection cycles, e.g. 15min')
+    parser.add_argument('--trade-interval', default='4h', help='Time between trading cycles, e.g. 4h')
+    parser.add_argument('--no-trading', action='store_true', help='Only collect data')
+    return parser.parse_args()
+
+def handleStopSignal(signum, frame):
+    logging.info("Received signal %s, stopping after the current cycle", signum)
+    stopEvent.set()
+
+def runCycle(name, cycle):
+    started = time.monotonic()
+    runMetrics.reset()
+    resetOrderFillLatencies()
+    try:
+        # Every cycle works on a fresh product listing
+        getMarketSnapshot(refresh=True)
+        cycle()
+        logging.info("%s cycle finished in %.2fs", name, time.monotonic() - started)
+    except Exception as e:
+        logging.exception("%s cycle failed after %.2fs: %s", name, time.monotonic() - started, e)
+    storeRunMetrics(engine, name.lower())
+
+def runScheduler(jobs):
+    # jobs: list of (name, cycle function, interval in seconds); runs in list order when several are due
+    nextRun = {name: time.monotonic() for name, _, _ in jobs}
+
+    while not stopEvent.is_set():
+        for name, cycle, interval in jobs:
+            if stopEvent.is_set():
+                break
+            if time.monotonic() >= nextRun[name]:
+                runCycle(name, cycle)
+                nextRun[name] += interval
+                if nextRun[name] < time.monotonic():
+                    # Missed slots are skipped instead of run back to back
+                    nextRun[name] = time.monotonic() + interval
+
+        stopEvent.wait(max(0, min(nextRun.values()) - time.monotonic()))
+
+if __name__ == '__main__':
+    daemonArgs = parseDaemonArguments()
+    signal.signal(signal.SIGTERM, handleStopSignal)
+    signal.signal(signal.SIGINT, handleStopSignal)
+
+    jobs = [('Data collection', dataLoader.runDataCollection, pd.Timedelta(daemonArgs.data_interval).total_seconds())]
+    if not daemonArgs.no_trading:
+        jobs.append(('Trading', tradingBot.runTradingCycle, pd.Timedelta(daemonArgs.trade_interval).total_seconds()))
+
+    logging.info("Daemon started with %s", [(name, interval) for name, _, interval in jobs])
+    runScheduler(jobs)
+
+    apiClient.close()
+    engine.dispose()
+    logging.info("Daemon stopped")
@@ -0,0 +1,111 @@
+from common_functions import *
+import base64
+from urllib.parse import urlsplit
+
+# Postgres table -> Elasticsearch indices written by elk-stack/logstash/pipeline/logstash.conf
+SYNCED_TABLES = {
+    'market_data': 'postgresql-market-data-*',
+    'trades': 'postgresql-trades-*',
+    'portfolio_value_history': 'postgresql-portfolio-history-*',
+}
+
+def parseValidationArguments():
+    parser = argparse.ArgumentParser(description="Check that every synced Postgres row is in Elasticsearch exactly once",
+                                     parents=[commonParser])
+    parser.add_argument('--table', action='append', choices=sorted(SYNCED_TABLES), help='Table to check, repeatable (default: all)')
+    parser.add_argument('--since-id', type=int, default=0, help='Only check rows with a higher id')
+    parser.add_argument('--grace-minutes', type=int, default=10,
+                        help='Ignore rows younger than this, Logstash ships new rows every 5 minutes')
+    parser.add_argument('--es-url', default=os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200'))
+    return parser.parse_args()
+
+class ElasticsearchClient:
+    def __init__(self, url, username=None, password=None):
+        parts = urlsplit(url)
+        self.host = parts.netloc
+        self.connectionClass = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.headers = {'Content-Type': 'application/json'}
+        if username:
+            credentials = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+            self.headers['Authorization'] = f"Basic {credentials}"
+
+    def request(self, method, path, body=None):
+        connection = self.connectionClass(self.host, timeout=60)
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None, self.headers)
+            response = connection.getresponse()
+            data = json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status}: {data}")
+        return data
+
+    def iterateDocumentIds(self, index, since_id=0):
+        # Scrolls through the ids only; _source is never fetched
+        page = self.request('POST', f"/{index}/_search?scroll=2m", {
+            'size': 10000,
+            '_source': False,
+            'sort': ['_doc'],
+            'query': {'range': {'id': {'gt': since_id}}},
+        })
+        try:
+            while page['hits']['hits']:
+                for hit in page['hits']['hits']:
+                    yield hit['_id']
+                page = self.request('POST', "/_search/scroll", {'scroll': '2m', 'scroll_id': page['_scroll_id']})
+        finally:
+            self.request('DELETE', "/_search/scroll", {'scroll_id': page['_scroll_id']})
+
+def fetchPostgresIds(table, since_id=0, grace_minutes=10):
+    query = text(f"""
+    SELECT id FROM {table}
+    WHERE id > :since_id
+    AND timestamp < CURRENT_TIMESTAMP - make_interval(mins => :grace_minutes)
+    """)
+    with engine.connect() as connection:
+        result = connection.execute(query, {"since_id": since_id, "grace_minutes": grace_minutes})
+        return np.fromiter((row[0] for row in result), dtype=np.int64)
+
+def validateTable(client, table, index, since_id=0, grace_minutes=10):
+    postgresIds = np.unique(fetchPostgresIds(table, since_id, grace_minutes))
+
+    documentIds = []
+    foreign = 0
+    for documentId in client.iterateDocumentIds(index, since_id):
+        if documentId.isdigit():
+            documentIds.append(int(documentId))
+        else:
+            foreign += 1  # Random ids written before the pipeline used document_id
+    documentIds, counts = np.unique(np.array(documentIds, dtype=np.int64), return_counts=True)
+
+    report = {
+        'rows': len(postgresIds),
+        'documents': int(counts.sum()) + foreign,
+        'missing': np.setdiff1d(postgresIds, documentIds, assume_unique=True),
+        'duplicated': documentIds[counts > 1],
+        'not_in_postgres': np.setdiff1d(documentIds, postgresIds, assume_unique=True),
+        'foreign': foreign,
+    }
+
+    print(f"{table} -> {index}: {report['rows']} rows, {report['documents']} documents, "
+          f"{len(report['missing'])} missing, {len(report['duplicated'])} duplicated, "
+          f"{len(report['not_in_postgres'])} not in Postgres, {foreign} without a row id")
+    if len(report['missing']):
+        print(f"  missing ids, e.g. {report['missing'][:10].tolist()}")
+    if len(report['duplicated']):
+        print(f"  duplicated ids, e.g. {report['duplicated'][:10].tolist()}")
+    return report
+
+if __name__ == '__main__':
+    validationArgs = parseValidationArguments()
+    client = ElasticsearchClient(validationArgs.es_url, os.getenv('ELASTICSEARCH_USERNAME'), os.getenv('ELASTICSEARCH_PASSWORD'))
+
+    failed = False
+    for table in validationArgs.table or sorted(SYNCED_TABLES):
+        report = validateTable(client, table, SYNCED_TABLES[table], validationArgs.since_id, validationArgs.grace_minutes)
+        # Rows pruned from market_data after they were shipped are expected in Elasticsearch, gaps and copies are not
+        failed |= bool(len(report['missing']) or len(report['duplicated']))
+
+    raise SystemExit(1 if failed else 0)